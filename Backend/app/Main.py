@@ -1,24 +1,101 @@
 """
 FastAPI Backend for RAG Chatbot
 """
+import asyncio
+import hashlib
+import json
 import logging
 import os
-import shutil
+import re
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from importlib.util import find_spec
 from threading import Lock
-from typing import Optional
-
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Body
+from typing import Annotated, Dict, Optional, Set, Tuple, Union
+
+import aiofiles
+import anyio.to_thread
+import httpx
+import orjson
+from fastapi import (
+    BackgroundTasks,
+    Body,
+    FastAPI,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, StringConstraints
 
 from rag_indexer import RAGIndexer
+from semantic_cache import LocalSemanticCache, SemanticCache
+
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "200"))
+
+# Micro-batching of concurrent questions into one indexer.query_batch call
+QUERY_BATCH_WINDOW = float(os.getenv("QUERY_BATCH_WINDOW_MS", "10")) / 1000
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "16"))
+query_queue: Optional[asyncio.Queue] = None
+_query_batch_tasks: Set[asyncio.Task] = set()
+
+# Shared HTTP connection pools for Azure OpenAI (created in lifespan)
+HTTP_TIMEOUT = 30.0
+HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+# HTTP/2 needs the optional h2 package (httpx[http2]); fall back to HTTP/1.1 without it
+HTTP2_ENABLED = find_spec("h2") is not None
+http_client: Optional[httpx.Client] = None
+http_async_client: Optional[httpx.AsyncClient] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the RAG indexer once per worker process at startup, before the
+    worker accepts traffic, instead of as an import-time side effect.
+    """
+    # Blocking indexer calls are offloaded to threads; size both the asyncio
+    # default executor and anyio's limiter (background tasks) for them.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="rag-worker")
+    )
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    # Pooled HTTP/2 clients shared by every Azure OpenAI call in this worker,
+    # so requests reuse warm TLS connections instead of handshaking each time.
+    global http_client, http_async_client, query_queue, rag_indexer_lock
+    rag_indexer_lock = asyncio.Lock()
+    http_client = httpx.Client(http2=HTTP2_ENABLED, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    http_async_client = httpx.AsyncClient(http2=HTTP2_ENABLED, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    app.state.http = http_async_client
+
+    await asyncio.to_thread(_initialise_indexer)
+
+    query_queue = asyncio.Queue()
+    batch_worker = asyncio.create_task(_query_batch_worker(query_queue))
+    try:
+        yield
+    finally:
+        batch_worker.cancel()
+        query_queue = None
+        await http_async_client.aclose()
+        http_client.close()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG Chatbot API",
     version="1.0.0",
-    description="Production-ready RAG Chatbot with Azure OpenAI and Azure AI Search"
+    description="Production-ready RAG Chatbot with Azure OpenAI and Azure AI Search",
+    lifespan=lifespan,
 )
 
 # Configure logging
@@ -37,26 +114,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Lazy Indexer Init
+# Indexer state (initialised in lifespan, retried lazily on demand)
 rag_indexer: Optional[RAGIndexer] = None
 rag_indexer_error: Optional[str] = None
-rag_indexer_lock = Lock()
+semantic_cache: Optional[Union[SemanticCache, LocalSemanticCache]] = None
+rag_indexer_lock: Optional[asyncio.Lock] = None  # created in lifespan, on the worker's loop
+
+# Circuit breaker: at most one re-init attempt per interval after a failure
+INDEXER_RETRY_SECONDS = float(os.getenv("INDEXER_RETRY_SECONDS", "30"))
+_last_init_attempt = 0.0
 
 
 def _initialise_indexer() -> None:
-    global rag_indexer, rag_indexer_error
+    global rag_indexer, rag_indexer_error, semantic_cache, _last_init_attempt, _health_degraded_body
+    _last_init_attempt = time.monotonic()
     try:
         logger.info("Initialising RAG indexer...")
-        rag_indexer = RAGIndexer()
+        rag_indexer = RAGIndexer(http_client=http_client, http_async_client=http_async_client)
         rag_indexer_error = None
-        logger.info("RAG indexer ready.")
     except (ValueError, RuntimeError, KeyError) as exc:
         rag_indexer = None
         rag_indexer_error = str(exc)
         logger.exception("Failed to initialise RAG indexer: %s", exc)
+        return
+    finally:
+        _last_init_attempt = time.monotonic()
+        _health_degraded_body = None
 
+    # The cache is optional: a bad cache setting must not take the indexer down
+    try:
+        semantic_cache = SemanticCache.from_env(rag_indexer.vector_dimensions)
+    except ValueError as exc:
+        semantic_cache = None
+        logger.warning("Semantic cache disabled by invalid configuration: %s", exc)
+    logger.info(
+        "RAG indexer ready (semantic cache %s).",
+        "enabled" if semantic_cache else "disabled",
+    )
 
-_initialise_indexer()
 
 # Upload directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -64,14 +159,73 @@ UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "30"))
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+UPLOAD_READ_SIZE = 1024 * 1024
 ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.txt']
 
+# Chat upload folder names: strip dot runs, neutralise separators in one pass
+_PATH_SEPARATORS = str.maketrans({"/": "_", "\\": "_", "\0": "_", ":": "_"})
+_DOTDOT_PATTERN = re.compile(r"\.{2,}")
+CHAT_DIR_MAX_LENGTH = 128
+
+# Resumable (chunked) uploads
+CHUNKED_UPLOAD_SIZE = 4 * 1024 * 1024
+UPLOAD_FLUSH_INTERVAL = 0.2  # seconds between fsyncs of an in-flight upload
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+# Uploads with no chunk activity for this long are aborted and their files removed
+PENDING_UPLOAD_TTL_SECONDS = float(os.getenv("PENDING_UPLOAD_TTL_SECONDS", "3600"))
+# Each pending upload holds an fd and its preallocated size on disk, so cap them
+MAX_PENDING_UPLOADS = int(os.getenv("MAX_PENDING_UPLOADS", "64"))
+MAX_PENDING_UPLOADS_PER_CHAT = int(os.getenv("MAX_PENDING_UPLOADS_PER_CHAT", "4"))
+
+
+@dataclass
+class UploadState:
+    """In-flight resumable upload, written in place at the chunk offsets."""
+    chat_id: str
+    chat_name: Optional[str]
+    filename: str
+    total_size: int
+    path: str
+    fd: int
+    received_ranges: Set[Tuple[int, int]] = field(default_factory=set)
+    last_flush: float = 0.0
+    last_activity: float = field(default_factory=time.monotonic)
+    closed: bool = False  # set under `lock` once fd is closed; writes must check it
+    lock: Lock = field(default_factory=Lock)
+
+
+pending_uploads: Dict[str, UploadState] = {}
+pending_uploads_lock = Lock()
+
+# Questions pre-answered into the semantic cache after each upload (0 disables)
+CACHE_WARMUP_QUESTIONS = int(os.getenv("CACHE_WARMUP_QUESTIONS", "3"))
+
+# Background document processing jobs: job_id -> {state, chunks, error, ...}
+UPLOAD_JOB_RETENTION_SECONDS = 3600
+upload_jobs: Dict[str, dict] = {}
+upload_jobs_lock = Lock()
+
+# /status payloads served without hitting Azure: chat_id -> (etag, payload, expires)
+STATUS_CACHE_TTL = 5.0
+STATUS_CACHE_MAX_ENTRIES = 1024
+status_cache: Dict[Optional[str], Tuple[str, dict, float]] = {}
+
+# Content hashes of uploads already accepted per chat: chat_id -> sha256 -> job_id
+upload_digests: Dict[str, Dict[str, str]] = {}
+
 
 # Pydantic Models
+# Required text fields are stripped and must be non-empty; violations are 422s
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
 class QueryRequest(BaseModel):
-    question: str
-    chat_id: str
-    chat_name: str = None  # Optional chat name for index lookup
+    model_config = ConfigDict(extra="forbid")
+
+    question: NonEmptyStr
+    chat_id: NonEmptyStr
+    chat_name: Optional[str] = None  # Optional chat name for index lookup
 
 
 class QueryResponse(BaseModel):
@@ -87,7 +241,18 @@ class StatusResponse(BaseModel):
 
 
 class ResetRequest(BaseModel):
-    chat_id: str
+    model_config = ConfigDict(extra="forbid")
+
+    chat_id: NonEmptyStr
+
+
+class UploadInitiateRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    chat_id: NonEmptyStr
+    filename: NonEmptyStr
+    total_size: int
+    chat_name: Optional[str] = None  # Optional chat name for index creation
 
 
 @app.get("/")
@@ -98,8 +263,11 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "upload": "/upload",
+            "upload_initiate": "/upload/initiate",
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "query": "/query",
             "status": "/status",
             "reset": "/reset"
@@ -107,115 +275,712 @@ async def root():
     }
 
 
+# /health bodies are pre-serialised; they only change when the indexer state does
+_HEALTH_OK_BODY = orjson.dumps({
+    "status": "ok",
+    "service": "RAG Chatbot API",
+    "version": "1.0.0",
+    "rag_indexer": "ready",
+})
+_health_degraded_body: Optional[bytes] = None
+
+
 @app.get("/health")
 async def health_check():
     """
     Health check endpoint
     Returns the health status of the API and its dependencies
     """
-    health_status = {
-        "status": "ok",
-        "service": "RAG Chatbot API",
-        "version": "1.0.0"
-    }
-    
-    # Check if RAG indexer is initialized
-    if rag_indexer is None:
-        health_status["status"] = "degraded"
-        health_status["rag_indexer"] = "not initialized"
+    global _health_degraded_body
+    if rag_indexer is not None:
+        return Response(content=_HEALTH_OK_BODY, media_type="application/json")
+
+    body = _health_degraded_body
+    if body is None:
+        health_status = {
+            "status": "degraded",
+            "service": "RAG Chatbot API",
+            "version": "1.0.0",
+            "rag_indexer": "not initialized",
+        }
         if rag_indexer_error:
             health_status["error"] = rag_indexer_error
-    else:
-        health_status["rag_indexer"] = "ready"
-    
-    return health_status
+        body = _health_degraded_body = orjson.dumps(health_status)
+    return Response(content=body, media_type="application/json")
 
 
-def _require_indexer() -> RAGIndexer:
-    global rag_indexer
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness endpoint
+    Returns 200 only once the RAG indexer is initialised, so load balancers
+    hold traffic until the worker can actually answer questions
+    """
     if rag_indexer is None:
-        with rag_indexer_lock:
-            if rag_indexer is None:
-                _initialise_indexer()
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "error": rag_indexer_error},
+        )
+    return {"ready": True}
 
-    if rag_indexer is None:
-        message = "RAG indexer unavailable. Check Azure credentials."
-        if rag_indexer_error:
-            message += f" Details: {rag_indexer_error}"
-        raise HTTPException(status_code=503, detail=message)
 
-    return rag_indexer
+async def _require_indexer() -> RAGIndexer:
+    """
+    Return the initialised indexer, or raise 503.
+
+    The hot path is a single read with no locking. While the indexer is down,
+    at most one re-init runs per INDEXER_RETRY_SECONDS; it is guarded by an
+    asyncio.Lock so concurrent callers wait cooperatively for its outcome
+    instead of blocking the event loop, and requests inside the cooldown
+    window fail fast without touching Azure.
+    """
+    indexer = rag_indexer
+    if indexer is not None:
+        return indexer
+
+    lock = rag_indexer_lock
+    if lock is not None and (
+        lock.locked() or time.monotonic() - _last_init_attempt >= INDEXER_RETRY_SECONDS
+    ):
+        async with lock:
+            if rag_indexer is None and time.monotonic() - _last_init_attempt >= INDEXER_RETRY_SECONDS:
+                await asyncio.to_thread(_initialise_indexer)
+
+    indexer = rag_indexer
+    if indexer is not None:
+        return indexer
+
+    message = "RAG indexer unavailable. Check Azure credentials."
+    error = rag_indexer_error
+    if error:
+        message += f" Details: {error}"
+    raise HTTPException(status_code=503, detail=message)
+
+
+async def _query_batch_worker(queue: asyncio.Queue):
+    """
+    Collect questions arriving within QUERY_BATCH_WINDOW of each other and
+    answer them with one indexer.query_batch call.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + QUERY_BATCH_WINDOW
+        while len(batch) < QUERY_BATCH_MAX_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Dispatch without waiting so the next window starts collecting now
+        task = asyncio.create_task(_run_query_batch(batch))
+        _query_batch_tasks.add(task)
+        task.add_done_callback(_query_batch_tasks.discard)
+
+
+async def _run_query_batch(batch: list):
+    """Answer one collected batch and resolve each caller's future."""
+    indexer = batch[0][0]
+    try:
+        results = await asyncio.to_thread(
+            indexer.query_batch,
+            [
+                (request.question, request.chat_id, request.chat_name, question_vector)
+                for _, request, question_vector, _ in batch
+            ],
+        )
+    except Exception as exc:
+        logger.exception("Batched query failed: %s", exc)
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+        return
+
+    for (_, _, _, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+
+async def _query_indexer(
+    indexer: RAGIndexer, request: QueryRequest, question_vector: Optional[list] = None
+) -> dict:
+    """Run a question through the micro-batcher, or directly if it isn't running."""
+    queue = query_queue
+    if queue is None:
+        return await asyncio.to_thread(
+            indexer.query, request.question, request.chat_id, request.chat_name, question_vector
+        )
+
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((indexer, request, question_vector, future))
+    return await future
+
+
+async def _answer_question(indexer: RAGIndexer, request: QueryRequest) -> dict:
+    """
+    Answer a question, serving near-duplicate questions from the semantic cache.
+    Shared by /chat and /query.
+    """
+    if semantic_cache is None:
+        return await _query_indexer(indexer, request)
+
+    question_vector = await asyncio.to_thread(indexer.embed_query, request.question)
+    cached = await asyncio.to_thread(semantic_cache.lookup, request.chat_id, question_vector)
+    if cached is not None:
+        return cached
+
+    result = await _query_indexer(indexer, request, question_vector)
+    if result["success"] and result["sources"]:
+        await asyncio.to_thread(
+            semantic_cache.store, request.chat_id, request.question, question_vector, result
+        )
+    return result
+
+
+async def _stream_answer(indexer: RAGIndexer, request: QueryRequest):
+    """
+    Yield NDJSON lines for /chat/stream. A semantic cache hit is replayed as a
+    single token; fresh answers with sources are stored once complete.
+    """
+    question_vector = None
+    if semantic_cache is not None:
+        question_vector = await indexer.aembed_query(request.question)
+        cached = await asyncio.to_thread(semantic_cache.lookup, request.chat_id, question_vector)
+        if cached is not None:
+            yield orjson.dumps({"type": "sources", "sources": cached["sources"]}) + b"\n"
+            yield orjson.dumps({"type": "token", "token": cached["answer"]}) + b"\n"
+            yield orjson.dumps({"type": "done", "success": True, "answer": cached["answer"]}) + b"\n"
+            return
+
+    sources = []
+    async for event in indexer.astream_query(
+        request.question, request.chat_id, request.chat_name, question_vector
+    ):
+        yield orjson.dumps(event) + b"\n"
+        if event["type"] == "sources":
+            sources = event["sources"]
+        elif event["type"] == "done" and semantic_cache is not None and event["success"] and sources:
+            result = {"success": True, "answer": event["answer"], "sources": sources}
+            await asyncio.to_thread(
+                semantic_cache.store, request.chat_id, request.question, question_vector, result
+            )
+
+
+def _invalidate_semantic_cache(chat_id: str):
+    """Drop cached answers for a chat whose documents changed."""
+    if semantic_cache is not None:
+        semantic_cache.clear(chat_id)
+
+
+def _store_status(chat_id: Optional[str], etag: str, payload: dict, now: float):
+    """
+    Cache a /status payload. Keys are client-supplied chat ids, so expired
+    entries are dropped on every write and the oldest go once the cache is full.
+    """
+    # Snapshot: upload jobs invalidate entries from worker threads
+    for key, (_, _, expires) in list(status_cache.items()):
+        if expires <= now:
+            status_cache.pop(key, None)
+    while len(status_cache) >= STATUS_CACHE_MAX_ENTRIES:
+        try:
+            status_cache.pop(next(iter(status_cache)), None)
+        except (StopIteration, RuntimeError):
+            break
+    status_cache[chat_id] = (etag, payload, now + STATUS_CACHE_TTL)
+
+
+def _invalidate_status_cache(chat_id: str):
+    """Drop cached /status payloads affected by a change to a chat's documents."""
+    status_cache.pop(chat_id, None)
+    status_cache.pop(None, None)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header (possibly a list or weak tags) against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def _safe_chat_id(chat_id: str) -> str:
+    """Map a chat_id to a single safe path component for its upload folder."""
+    safe = _DOTDOT_PATTERN.sub("", chat_id).translate(_PATH_SEPARATORS)
+    if len(safe) > CHAT_DIR_MAX_LENGTH:
+        # Keep long ids that share a prefix apart with a hash of the full id
+        suffix = hashlib.sha256(chat_id.encode("utf-8")).hexdigest()[:8]
+        safe = f"{safe[:CHAT_DIR_MAX_LENGTH - len(suffix) - 1]}-{suffix}"
+    # Never resolve to the uploads root itself
+    return safe if safe not in ("", ".") else "_"
 
 
 def _ensure_chat_upload_dir(chat_id: str) -> str:
-    safe = chat_id.replace("..", "").replace("/", "_").replace("\\", "_")
-    chat_dir = os.path.join(UPLOAD_DIR, safe)
+    chat_dir = os.path.join(UPLOAD_DIR, _safe_chat_id(chat_id))
     os.makedirs(chat_dir, exist_ok=True)
     return chat_dir
 
 
+def _fast_rmtree(path: str):
+    """
+    Remove a directory tree with one scandir pass per directory.
+    Upload folders are flat, so this skips most of rmtree's per-entry stat calls.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    _fast_rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+    os.rmdir(path)
+
+
 def _delete_chat_uploads(chat_id: str):
-    safe = chat_id.replace("..", "").replace("/", "_").replace("\\", "_")
-    chat_dir = os.path.join(UPLOAD_DIR, safe)
-    if os.path.isdir(chat_dir):
-        shutil.rmtree(chat_dir, ignore_errors=True)
+    chat_dir = os.path.join(UPLOAD_DIR, _safe_chat_id(chat_id))
+    try:
+        _fast_rmtree(chat_dir)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.warning("Could not fully remove uploads for chat %s: %s", chat_id, exc)
+
+
+def _validate_upload_filename(filename: Optional[str]) -> str:
+    """Return the lowercased extension of an upload, rejecting unsupported types."""
+    if not filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}",
+        )
+    return ext
+
+
+def _update_upload_job(job_id: str, **fields):
+    if fields.get("state") in ("completed", "failed"):
+        fields["finished_at"] = time.monotonic()
+    with upload_jobs_lock:
+        upload_jobs[job_id].update(fields)
+
+
+def _prune_upload_jobs():
+    """
+    Forget finished jobs once clients have had time to poll them. Jobs that
+    back a dedup entry are kept so re-uploads can still report their result.
+    """
+    cutoff = time.monotonic() - UPLOAD_JOB_RETENTION_SECONDS
+    with upload_jobs_lock:
+        expired = [
+            job_id for job_id, job in upload_jobs.items()
+            if job.get("finished_at") is not None
+            and job["finished_at"] < cutoff
+            and upload_digests.get(job["chat_id"], {}).get(job.get("digest")) != job_id
+        ]
+        for job_id in expired:
+            del upload_jobs[job_id]
+
+
+def _fail_upload_job(job_id: str, error: str):
+    """Mark a job failed and release its dedup entry so the file can be retried."""
+    _update_upload_job(job_id, state="failed", error=error)
+    with upload_jobs_lock:
+        job = upload_jobs[job_id]
+        digests = upload_digests.get(job["chat_id"], {})
+        if digests.get(job.get("digest")) == job_id:
+            del digests[job["digest"]]
+
+
+def _find_duplicate_upload(chat_id: str, digest: str) -> Optional[dict]:
+    """Return the job that already accepted this content for the chat, if any."""
+    with upload_jobs_lock:
+        job_id = upload_digests.get(chat_id, {}).get(digest)
+        job = upload_jobs.get(job_id) if job_id else None
+        return dict(job) if job is not None else None
+
+
+def _run_upload_job(
+    job_id: str, indexer: RAGIndexer, path: str, filename: str, chat_id: str, chat_name: Optional[str]
+):
+    """Process a stored upload in the background and record the outcome on its job."""
+    _update_upload_job(job_id, state="processing")
+    try:
+        result = indexer.process_document(path, filename, chat_id, chat_name)
+    except Exception as exc:
+        logger.exception("Background processing failed for %s: %s", filename, exc)
+        _fail_upload_job(job_id, str(exc))
+        return
+
+    if not result["success"]:
+        _fail_upload_job(job_id, result["message"])
+        return
+
+    _invalidate_semantic_cache(chat_id)
+    _invalidate_status_cache(chat_id)
+    _update_upload_job(
+        job_id,
+        state="completed",
+        message=result["message"],
+        chunks=result["chunks"],
+    )
+
+    if semantic_cache is not None and CACHE_WARMUP_QUESTIONS > 0:
+        _warm_semantic_cache(indexer, chat_id, chat_name, result.get("excerpt", ""))
+
+
+def _warm_semantic_cache(
+    indexer: RAGIndexer, chat_id: str, chat_name: Optional[str], excerpt: str
+):
+    """
+    Pre-answer the questions users are likely to ask about a fresh upload and
+    store them in the semantic cache, so the first real question can be a hit.
+    Runs after the job is marked completed, so it never delays the upload.
+    """
+    try:
+        questions = indexer.suggest_questions(excerpt, CACHE_WARMUP_QUESTIONS)
+        if not questions:
+            return
+        vectors = indexer.embed_questions(questions)
+        results = indexer.query_batch(
+            [(q, chat_id, chat_name, v) for q, v in zip(questions, vectors)],
+            record_history=False,
+        )
+        for question, vector, result in zip(questions, vectors, results):
+            if result["success"] and result["sources"]:
+                semantic_cache.store(chat_id, question, vector, result)
+        logger.info("Warmed semantic cache for chat %s with %d questions.", chat_id, len(questions))
+    except Exception as exc:
+        logger.warning("Semantic cache warm-up failed for chat %s: %s", chat_id, exc)
+
+
+def _queue_uploaded_file(
+    background_tasks: BackgroundTasks,
+    indexer: RAGIndexer,
+    path: str,
+    filename: str,
+    chat_id: str,
+    chat_name: Optional[str],
+    digest: Optional[str] = None,
+) -> dict:
+    """Queue a stored upload for background processing and build the 202 response."""
+    _prune_upload_jobs()
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "state": "queued",
+        "filename": filename,
+        "chat_id": chat_id,
+        "message": f"Processing {filename}",
+        "chunks": 0,
+        "error": None,
+        "digest": digest,
+        "finished_at": None,
+    }
+    with upload_jobs_lock:
+        upload_jobs[job_id] = job
+        if digest:
+            upload_digests.setdefault(chat_id, {})[digest] = job_id
+
+    background_tasks.add_task(
+        _run_upload_job, job_id, indexer, path, filename, chat_id, chat_name
+    )
+
+    return {
+        "success": True,
+        "message": job["message"],
+        "filename": filename,
+        "chat_id": chat_id,
+        "job_id": job_id,
+        "state": job["state"],
+        "status_url": f"/upload/{job_id}/status",
+    }
+
+
+def _preallocate(fd: int, size: int):
+    """Reserve disk space for an upload so chunks can be written at any offset."""
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.ftruncate(fd, size)
+
+
+def _write_chunk(state: UploadState, data: bytes, offset: int):
+    """
+    Write one chunk at its offset and record the received byte range.
+    The lock is held across the write so the fd can't be closed (and reused
+    by another file) underneath it by completion, reset or expiry.
+    """
+    with state.lock:
+        if state.closed:
+            raise HTTPException(status_code=409, detail="Upload is no longer in progress")
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            position = offset
+            while view:
+                written = os.pwrite(state.fd, view, position)
+                view = view[written:]
+                position += written
+        else:
+            os.lseek(state.fd, offset, os.SEEK_SET)
+            os.write(state.fd, data)
+
+        state.received_ranges.add((offset, offset + len(data) - 1))
+        now = time.monotonic()
+        state.last_activity = now
+        if now - state.last_flush >= UPLOAD_FLUSH_INTERVAL:
+            os.fsync(state.fd)
+            state.last_flush = now
+
+
+def _close_upload(state: UploadState, *, sync: bool = False, remove: bool = False):
+    """Close an upload's fd once, optionally fsyncing first or deleting the partial file."""
+    with state.lock:
+        if state.closed:
+            return
+        state.closed = True
+        try:
+            if sync:
+                os.fsync(state.fd)
+        finally:
+            os.close(state.fd)
+    if remove:
+        try:
+            os.unlink(state.path)
+        except FileNotFoundError:
+            pass
+
+
+def _received_bytes(state: UploadState) -> int:
+    """Count distinct bytes received, merging overlapping or retried ranges."""
+    received = 0
+    cursor = 0
+    with state.lock:
+        ranges = sorted(state.received_ranges)
+    for start, end in ranges:
+        start = max(start, cursor)
+        if end >= start:
+            received += end - start + 1
+            cursor = end + 1
+    return received
+
+
+def _get_pending_upload(upload_id: str) -> UploadState:
+    with pending_uploads_lock:
+        state = pending_uploads.get(upload_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown upload_id")
+    return state
+
+
+def _discard_pending_uploads(chat_id: str):
+    """Abort in-flight resumable uploads for a chat and release their files."""
+    with pending_uploads_lock:
+        upload_ids = [uid for uid, state in pending_uploads.items() if state.chat_id == chat_id]
+        states = [pending_uploads.pop(uid) for uid in upload_ids]
+    for state in states:
+        try:
+            _close_upload(state, remove=True)
+        except OSError:
+            pass
+
+
+def _check_pending_upload_limits(chat_id: str):
+    """Raise 429 when too many uploads are pending overall or for a chat. Caller holds pending_uploads_lock."""
+    if len(pending_uploads) >= MAX_PENDING_UPLOADS:
+        raise HTTPException(status_code=429, detail="Too many uploads in progress; try again later")
+    per_chat = sum(1 for state in pending_uploads.values() if state.chat_id == chat_id)
+    if per_chat >= MAX_PENDING_UPLOADS_PER_CHAT:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many uploads in progress for this chat; complete or retry later",
+        )
+
+
+def _prune_pending_uploads():
+    """Abort resumable uploads idle for longer than PENDING_UPLOAD_TTL_SECONDS."""
+    cutoff = time.monotonic() - PENDING_UPLOAD_TTL_SECONDS
+    with pending_uploads_lock:
+        expired = [uid for uid, state in pending_uploads.items() if state.last_activity < cutoff]
+        states = [pending_uploads.pop(uid) for uid in expired]
+    for state in states:
+        logger.info("Expiring abandoned upload of %s for chat %s.", state.filename, state.chat_id)
+        try:
+            _close_upload(state, remove=True)
+        except OSError:
+            pass
 
 
 # ================================================================
 #  UPLOAD DOCUMENT
 # ================================================================
-@app.post("/upload")
+@app.post("/upload", status_code=202)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     chat_id: str = Form(...), 
     chat_name: str = Form(None),
     file: UploadFile = File(...)
 ):
     try:
-        indexer = _require_indexer()
+        indexer = await _require_indexer()
 
         if not chat_id.strip():
             raise HTTPException(status_code=400, detail="chat_id is required")
 
-        if not file or not file.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
+        ext = _validate_upload_filename(file.filename if file else None)
 
-        ext = os.path.splitext(file.filename)[1].lower()
+        upload_dir = _ensure_chat_upload_dir(chat_id)
+        unique_name = uuid.uuid4().hex + ext
+        path = os.path.join(upload_dir, unique_name)
 
-        if ext not in ALLOWED_EXTENSIONS:
+        # Stream to disk without blocking the event loop, enforcing the size
+        # limit as bytes arrive instead of probing the spooled file up front.
+        # The content hash is computed on the same pass for dedup.
+        total = 0
+        too_large = False
+        sha256 = hashlib.sha256()
+        async with aiofiles.open(path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_READ_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > MAX_FILE_SIZE_BYTES:
+                    too_large = True
+                    break
+                sha256.update(chunk)
+                await buffer.write(chunk)
+
+        if too_large:
+            os.remove(path)
             raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}",
+                status_code=413,
+                detail=f"File too large. Limit: {MAX_FILE_SIZE_MB}MB",
+            )
+
+        digest = sha256.hexdigest()
+        duplicate = _find_duplicate_upload(chat_id, digest)
+        if duplicate is not None and duplicate["state"] != "failed":
+            os.remove(path)
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "success": True,
+                    "message": f"{file.filename} was already uploaded to this chat",
+                    "filename": file.filename,
+                    "chat_id": chat_id,
+                    "job_id": duplicate["job_id"],
+                    "state": duplicate["state"],
+                    "chunks": duplicate["chunks"],
+                    "cached": True,
+                    "status_url": f"/upload/{duplicate['job_id']}/status",
+                },
             )
 
-        file.file.seek(0, os.SEEK_END)
-        size = file.file.tell()
-        file.file.seek(0)
+        stored_path = os.path.join(upload_dir, digest + ext)
+        os.replace(path, stored_path)
 
-        if size / (1024 * 1024) > MAX_FILE_SIZE_MB:
+        return _queue_uploaded_file(
+            background_tasks, indexer, stored_path, file.filename, chat_id, chat_name, digest
+        )
+
+    except (ValueError, RuntimeError, IOError) as e:
+        logger.exception("Upload problem: %s", e)
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+# ================================================================
+#  RESUMABLE UPLOAD (initiate -> PUT chunks -> complete)
+# ================================================================
+@app.post("/upload/initiate")
+async def initiate_upload(request: UploadInitiateRequest):
+    """
+    Start a resumable upload. The client then PUTs chunks with a
+    Content-Range header and calls /upload/{upload_id}/complete.
+    """
+    try:
+        ext = _validate_upload_filename(request.filename)
+
+        if request.total_size <= 0:
+            raise HTTPException(status_code=400, detail="total_size must be positive")
+
+        if request.total_size > MAX_FILE_SIZE_BYTES:
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Limit: {MAX_FILE_SIZE_MB}MB",
             )
 
-        upload_dir = _ensure_chat_upload_dir(chat_id)
-        unique_name = uuid.uuid4().hex + ext
-        path = os.path.join(upload_dir, unique_name)
+        await asyncio.to_thread(_prune_pending_uploads)
+        with pending_uploads_lock:
+            _check_pending_upload_limits(request.chat_id)
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(_ensure_chat_upload_dir(request.chat_id), upload_id + ext)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+        state = UploadState(
+            chat_id=request.chat_id,
+            chat_name=request.chat_name,
+            filename=request.filename,
+            total_size=request.total_size,
+            path=path,
+            fd=fd,
+        )
+        try:
+            await asyncio.to_thread(_preallocate, fd, request.total_size)
+            with pending_uploads_lock:
+                # Re-check: concurrent initiates may have filled the slots meanwhile
+                _check_pending_upload_limits(request.chat_id)
+                pending_uploads[upload_id] = state
+        except BaseException:
+            _close_upload(state, remove=True)
+            raise
 
-        with open(path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return {"upload_id": upload_id, "chunk_size": CHUNKED_UPLOAD_SIZE}
 
-        result = indexer.process_document(path, file.filename, chat_id, chat_name)
+    except (ValueError, RuntimeError, IOError) as e:
+        logger.exception("Upload problem: %s", e)
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
-        if not result["success"]:
-            raise HTTPException(status_code=400, detail=result["message"])
+
+@app.put("/upload/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    content_range: str = Header(...),
+):
+    """Write one chunk of a resumable upload at the offset given by Content-Range."""
+    try:
+        state = _get_pending_upload(upload_id)
+
+        match = CONTENT_RANGE_PATTERN.match(content_range.strip())
+        if not match:
+            raise HTTPException(
+                status_code=400,
+                detail="Content-Range must look like 'bytes start-end/total'",
+            )
+        start, end, total = (int(group) for group in match.groups())
+
+        if total != state.total_size or start > end or end >= total:
+            raise HTTPException(status_code=416, detail="Content-Range outside upload bounds")
+
+        body = await request.body()
+        if len(body) != end - start + 1:
+            raise HTTPException(
+                status_code=400,
+                detail="Chunk length does not match Content-Range",
+            )
+
+        await asyncio.to_thread(_write_chunk, state, body, start)
 
         return {
-            "success": True,
-            "message": result["message"],
-            "filename": file.filename,
-            "chunks": result["chunks"],
-            "chat_id": chat_id,
-            "has_documents": True,
+            "upload_id": upload_id,
+            "received_bytes": _received_bytes(state),
+            "total_size": state.total_size,
         }
 
     except (ValueError, RuntimeError, IOError) as e:
@@ -223,6 +988,49 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
+@app.post("/upload/{upload_id}/complete", status_code=202)
+async def complete_upload(upload_id: str, background_tasks: BackgroundTasks):
+    """Verify every byte of a resumable upload arrived, then queue it for indexing."""
+    try:
+        indexer = await _require_indexer()
+        state = _get_pending_upload(upload_id)
+
+        if _received_bytes(state) != state.total_size:
+            raise HTTPException(
+                status_code=409,
+                detail="Upload incomplete; resend the missing ranges before completing",
+            )
+
+        with pending_uploads_lock:
+            if pending_uploads.pop(upload_id, None) is None:
+                raise HTTPException(status_code=404, detail="Unknown upload_id")
+
+        await asyncio.to_thread(_close_upload, state, sync=True)
+
+        return _queue_uploaded_file(
+            background_tasks, indexer, state.path, state.filename, state.chat_id, state.chat_name
+        )
+
+    except (ValueError, RuntimeError, IOError) as e:
+        logger.exception("Upload problem: %s", e)
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@app.get("/upload/{job_id}/status")
+async def upload_status(job_id: str):
+    """Report the processing state of a queued upload."""
+    with upload_jobs_lock:
+        job = upload_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job_id")
+        job = dict(job)
+
+    job.pop("finished_at", None)
+    job.pop("digest", None)
+    job["has_documents"] = job["state"] == "completed"
+    return job
+
+
 # ================================================================
 #  CHAT ENDPOINT (Alias for query, supports future streaming)
 # ================================================================
@@ -230,18 +1038,15 @@ async def upload_file(
 async def chat(request: QueryRequest = Body(...)):
     """
     Chat endpoint - currently aliases to query endpoint
-    Future: Will support streaming responses
+    (see /chat/stream for a token-streaming variant)
     """
     try:
-        if not request.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
-
-        if not request.chat_id.strip():
-            raise HTTPException(status_code=400, detail="chat_id is required")
+        indexer = await _require_indexer()
+        result = await _answer_question(indexer, request)
 
-        result = _require_indexer().query(request.question, request.chat_id, request.chat_name)
-
-        return QueryResponse(
+        # Indexer results are already well-formed; skip the input-side validation
+        # (response_model still validates and serializes the response)
+        return QueryResponse.model_construct(
             success=result["success"],
             answer=result["answer"],
             sources=result["sources"],
@@ -252,21 +1057,30 @@ async def chat(request: QueryRequest = Body(...)):
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: QueryRequest = Body(...)):
+    """
+    Streaming chat endpoint. Responds with NDJSON events: the sources, then
+    the answer tokens as the LLM generates them, then a final "done" event.
+    """
+    indexer = await _require_indexer()
+    return StreamingResponse(
+        _stream_answer(indexer, request), media_type="application/x-ndjson"
+    )
+
+
 # ================================================================
 #  FIXED QUERY ENDPOINT (MAIN ISSUE)
 # ================================================================
 @app.post("/query", response_model=QueryResponse)
 async def query_rag(request: QueryRequest = Body(...)):
     try:
-        if not request.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
+        indexer = await _require_indexer()
+        result = await _answer_question(indexer, request)
 
-        if not request.chat_id.strip():
-            raise HTTPException(status_code=400, detail="chat_id is required")
-
-        result = _require_indexer().query(request.question, request.chat_id, request.chat_name)
-
-        return QueryResponse(
+        # Indexer results are already well-formed; skip the input-side validation
+        # (response_model still validates and serializes the response)
+        return QueryResponse.model_construct(
             success=result["success"],
             answer=result["answer"],
             sources=result["sources"],
@@ -280,10 +1094,16 @@ async def query_rag(request: QueryRequest = Body(...)):
 #  STATUS
 # ================================================================
 @app.get("/status", response_model=StatusResponse)
-async def get_status(chat_id: Optional[str] = Query(default=None)):
+async def get_status(
+    request: Request, response: Response, chat_id: Optional[str] = Query(default=None)
+):
+    """
+    Status endpoint with conditional GET support: polls that send back the
+    last ETag get 304, and results are reused for a few seconds.
+    """
     try:
         try:
-            indexer = _require_indexer()
+            indexer = await _require_indexer()
         except HTTPException as exc:
             return StatusResponse(
                 has_documents=False,
@@ -291,8 +1111,21 @@ async def get_status(chat_id: Optional[str] = Query(default=None)):
                 message=str(exc.detail),
             )
 
-        status = indexer.get_status(chat_id)
-        return StatusResponse(**status)
+        now = time.monotonic()
+        cached = status_cache.get(chat_id)
+        if cached is not None and cached[2] > now:
+            etag, payload, _ = cached
+        else:
+            payload = await asyncio.to_thread(indexer.get_status, chat_id)
+            digest = hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+            etag = f'"{digest}"'
+            _store_status(chat_id, etag, payload, now)
+
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        response.headers["ETag"] = etag
+        return StatusResponse(**payload)
 
     except (ValueError, RuntimeError, KeyError) as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
@@ -304,13 +1137,15 @@ async def get_status(chat_id: Optional[str] = Query(default=None)):
 @app.post("/reset")
 async def reset_system(request: ResetRequest):
     try:
-        if not request.chat_id.strip():
-            raise HTTPException(status_code=400, detail="chat_id is required")
-
-        indexer = _require_indexer()
-        result = indexer.reset(request.chat_id)
+        indexer = await _require_indexer()
+        result = await asyncio.to_thread(indexer.reset, request.chat_id)
 
-        _delete_chat_uploads(request.chat_id)
+        await asyncio.to_thread(_invalidate_semantic_cache, request.chat_id)
+        _invalidate_status_cache(request.chat_id)
+        _discard_pending_uploads(request.chat_id)
+        with upload_jobs_lock:
+            upload_digests.pop(request.chat_id, None)
+        await asyncio.to_thread(_delete_chat_uploads, request.chat_id)
 
         return result
 
@@ -320,5 +1155,15 @@ async def reset_system(request: ResetRequest):
 
 
 if __name__ == "__main__":
+
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    # uvloop/httptools ship with uvicorn[standard]; uvloop is unavailable on Windows.
+    # One worker only: upload jobs, pending uploads and digests live in this process.
+    uvicorn.run(
+        "Main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if find_spec("uvloop") else "asyncio",
+        http="httptools" if find_spec("httptools") else "h11",
+    )
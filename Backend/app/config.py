@@ -27,6 +27,12 @@ class Settings(BaseSettings):
     max_file_size_mb: int = 30
     vector_dimensions: Optional[int] = None
     
+    # Semantic Cache (optional; Redis Stack, or in-process when local size > 0)
+    redis_url: Optional[str] = None
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_ttl: int = 3600
+    semantic_cache_local_size: int = 0
+    
     # CORS Origins
     cors_origins: list = [
         "http://localhost:5173",
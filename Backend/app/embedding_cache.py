@@ -0,0 +1,181 @@
+"""
+Caches for Azure OpenAI embeddings
+"""
+import array
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock, RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("embedding-cache")
+
+# SQLite caps bound parameters per statement; stay well below the limit
+_SQLITE_BATCH = 500
+
+
+def to_vec(vector: Iterable[float]) -> np.ndarray:
+    """
+    Convert an embedding to an L2-normalized float32 array.
+
+    Cosine similarity between normalized vectors is a plain dot product, and
+    float32 halves the memory of Python floats / float64 arrays.
+    """
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec = vec / norm
+    return vec
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache with a TTL for question embeddings.
+
+    Keys are SHA-256 digests of the exact question text, so repeated questions
+    skip the remote embedding call. Vectors are kept as normalized float32
+    arrays (see to_vec).
+    """
+
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 600):
+        """
+        Args:
+            max_size: Maximum number of cached embeddings
+            ttl_seconds: Seconds before a cached embedding expires
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = RLock()
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha256(question.encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a question, or None if missing or expired."""
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def put(self, question: str, vector: Iterable[float]) -> np.ndarray:
+        """
+        Cache an embedding, evicting the least recently used entry when full.
+
+        Returns:
+            The normalized float32 vector that was stored
+        """
+        key = self._key(question)
+        vector = to_vec(vector)
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector
+
+    def clear(self):
+        """Drop every cached embedding."""
+        with self._lock:
+            self._entries.clear()
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of document chunk embeddings keyed by content hash.
+
+    Vectors are stored as packed float32 blobs. Any SQLite error is logged and
+    treated as a cache miss, so ingestion never fails because of the cache.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dimensions (deployment TEXT PRIMARY KEY, dims INTEGER NOT NULL)"
+            )
+
+    @staticmethod
+    def key_for(deployment: str, text: str) -> str:
+        """Cache key for a chunk embedded by a given deployment."""
+        return hashlib.sha256(f"{deployment}|{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given hashes; missing hashes are omitted."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        try:
+            with self._lock:
+                for start in range(0, len(unique), _SQLITE_BATCH):
+                    batch = unique[start:start + _SQLITE_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array.array("f")
+                        vector.frombytes(blob)
+                        found[key] = vector.tolist()
+        except sqlite3.Error as exc:
+            logger.warning("Embedding cache read failed: %s", exc)
+            return {}
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]):
+        """Store (hash, vector) pairs, replacing existing entries."""
+        rows = [(key, array.array("f", vector).tobytes()) for key, vector in items]
+        if not rows:
+            return
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)", rows
+                )
+        except sqlite3.Error as exc:
+            logger.warning("Embedding cache write failed: %s", exc)
+
+    def get_dimension(self, deployment: str) -> Optional[int]:
+        """Return the embedding dimension last recorded for a deployment, if any."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT dims FROM dimensions WHERE deployment = ?", (deployment,)
+                ).fetchone()
+        except sqlite3.Error as exc:
+            logger.warning("Embedding cache read failed: %s", exc)
+            return None
+        return row[0] if row else None
+
+    def put_dimension(self, deployment: str, dims: int):
+        """Record the embedding dimension a deployment returned."""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dimensions (deployment, dims) VALUES (?, ?)",
+                    (deployment, dims),
+                )
+        except sqlite3.Error as exc:
+            logger.warning("Embedding cache write failed: %s", exc)
@@ -1,18 +1,31 @@
 """
 RAG Indexer for document processing and retrieval using Azure AI Search
 """
+import asyncio
 import logging
 import os
+import random
 import re
-from typing import Dict, List, Optional
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Lock
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+import httpx
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import AzureOpenAIEmbeddings, AzureChatOpenAI
-from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from openai import RateLimitError
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
-from azure.core.exceptions import ResourceNotFoundError
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from azure.search.documents.indexes import SearchIndexClient
@@ -25,10 +38,99 @@ from azure.search.documents.indexes.models import (
     VectorSearchProfile
 )
 
-from utils import extract_text_from_file
+try:
+    from langchain_experimental.text_splitter import SemanticChunker  # optional, for CHUNK_STRATEGY=semantic
+except ImportError:
+    SemanticChunker = None
+
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from utils import SPLIT_PARALLEL_MIN_CHARS, extract_text_from_file, split_text_in_pool
 
 logger = logging.getLogger("rag-indexer")
 
+# Key and index name sanitization patterns
+_DOCUMENT_ID_INVALID = re.compile(r"[^A-Za-z0-9_\-=]")
+_INDEX_NAME_INVALID = re.compile(r"[^a-z0-9\-]")
+_HYPHEN_RUNS = re.compile(r"-+")
+
+RAG_PROMPT = ChatPromptTemplate.from_template(
+    """You are a helpful AI assistant. Use the following context from documents to answer the question. If you cannot find the answer in the context, say so.
+
+Chat History:
+{history}
+
+Context from documents:
+{context}
+
+Question: {question}
+
+Answer:"""
+)
+
+SUGGEST_QUESTIONS_PROMPT = ChatPromptTemplate.from_template(
+    """Here is the beginning of a document a user just uploaded:
+
+{excerpt}
+
+List the {count} questions the user is most likely to ask about this document, one per line, with no numbering or extra text."""
+)
+
+EXCERPT_MAX_CHARS = 4000
+
+# HNSW graph parameters for new indexes: links per node, build-time and
+# query-time candidate list sizes (efSearch bounds the work per query).
+# Azure AI Search accepts m in 4-10 and efConstruction/efSearch in 100-1000.
+# Env var -> (index parameter, default, min, max); parsed in _validate_environment
+# so a bad value degrades the indexer instead of failing the import.
+HNSW_SETTINGS = {
+    "HNSW_M": ("m", 10, 4, 10),
+    "HNSW_EF_CONSTRUCTION": ("efConstruction", 200, 100, 1000),
+    "HNSW_EF_SEARCH": ("efSearch", 100, 100, 1000),
+}
+
+# Document embedding: chunks per request, concurrent requests, rate-limit retries.
+# One module-level pool is shared by every upload so ingestion doesn't spawn threads.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))
+EMBED_MAX_RETRIES = 5
+_embedding_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EMBED_PARALLELISM", "4")),
+    thread_name_prefix="embed",
+)
+
+# Chat-scoped searches of a batched query run concurrently on a shared pool
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_PARALLELISM", "16")),
+    thread_name_prefix="retrieve",
+)
+
+# Document deletion: ids per request, concurrent requests, throttling retries, and
+# search passes (deleting while paging can skip documents, so re-check until empty)
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_RETRIES = 5
+DELETE_MAX_PASSES = 3
+_delete_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DELETE_PARALLELISM", "4")),
+    thread_name_prefix="delete",
+)
+
+# Chunk upload batch sizing: each index starts at the initial size, halves with
+# backoff when throttled and grows 25% after a streak of clean batches
+UPLOAD_INITIAL_BATCH_SIZE = 100
+UPLOAD_MAX_BATCH_SIZE = 1000
+UPLOAD_GROWTH_STREAK = 3
+UPLOAD_MAX_RETRIES = 8
+UPLOAD_RETRY_STATUSES = {409, 413, 422, 429, 503}
+
+# Failed chunk ids included in an indexing error message
+MAX_REPORTED_FAILURES = 5
+
+# OData filter strings memoized per chat_id; oldest entries are evicted past this
+FILTER_CACHE_MAX_ENTRIES = 1024
+
+# Exchanges kept per chat; only the most recent few are sent to the LLM
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", "20"))
+PROMPT_HISTORY_TURNS = 3
+
 # Load environment variables
 load_dotenv()
 
@@ -38,8 +140,18 @@ class RAGIndexer:
     Manages document indexing and retrieval for RAG chatbot using Azure AI Search.
     """
     
-    def __init__(self):
-        """Initialize the RAG indexer with Azure OpenAI embeddings and Azure AI Search."""
+    def __init__(
+        self,
+        http_client: Optional[httpx.Client] = None,
+        http_async_client: Optional[httpx.AsyncClient] = None,
+    ):
+        """
+        Initialize the RAG indexer with Azure OpenAI embeddings and Azure AI Search.
+        
+        Args:
+            http_client: Shared pooled client for Azure OpenAI calls (optional)
+            http_async_client: Shared pooled async client for Azure OpenAI calls (optional)
+        """
         # Load environment variables
         self.search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
         self.search_key = os.getenv("AZURE_SEARCH_KEY")
@@ -52,41 +164,47 @@ class RAGIndexer:
 
         self._validate_environment()
         
-        # Cache for per-chat search clients
-        self.search_clients: Dict[str, SearchClient] = {}
-        
-        # Cache for per-chat search clients
-        self.search_clients: Dict[str, SearchClient] = {}
+        self._init_caches()
         
         # Initialize Azure OpenAI Embeddings
         self.embeddings = AzureOpenAIEmbeddings(
             azure_deployment=self.embedding_deployment,
             openai_api_version=self.api_version,
             azure_endpoint=self.azure_openai_endpoint,
-            api_key=self.azure_openai_key
+            api_key=self.azure_openai_key,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+
+        # Persistent chunk embedding cache, so re-ingested text isn't re-embedded
+        embedding_cache_path = os.getenv(
+            "EMBEDDING_CACHE_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3"),
         )
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if embedding_cache_path:
+            try:
+                self.embedding_cache = EmbeddingCache(embedding_cache_path)
+            except sqlite3.Error as exc:
+                logger.warning("Embedding cache disabled: %s", exc)
 
+        # Initialize Azure Search clients. One credential and one pooled
+        # transport are shared by every client, so TCP/TLS connections are
+        # reused across chats instead of each client opening its own.
+        self._credential = AzureKeyCredential(self.search_key)
+        self._transport = self._create_search_transport()
+        self.index_client = SearchIndexClient(
+            endpoint=self.search_endpoint,
+            credential=self._credential,
+            transport=self._transport,
+        )
+        
         vector_dims_env = os.getenv("VECTOR_DIMENSIONS")
         if vector_dims_env:
             self.vector_dimensions = int(vector_dims_env)
             logger.info("Using VECTOR_DIMENSIONS override: %s", self.vector_dimensions)
         else:
-            probe_embedding = self.embeddings.embed_query("dimension probe")
-            if not probe_embedding:
-                raise RuntimeError("Failed to detect embedding dimensions from Azure OpenAI.")
-            self.vector_dimensions = len(probe_embedding)
-            logger.info(
-                "Detected embedding dimension %s from Azure OpenAI deployment '%s'.",
-                self.vector_dimensions,
-                self.embedding_deployment,
-            )
-        
-        # Initialize Azure Search clients
-        credential = AzureKeyCredential(self.search_key)
-        self.index_client = SearchIndexClient(
-            endpoint=self.search_endpoint,
-            credential=credential
-        )
+            self.vector_dimensions = self._detect_vector_dimensions()
         
         # Create or get default search index (for backward compatibility)
         self._create_search_index_for_name(self.index_name)
@@ -95,17 +213,16 @@ class RAGIndexer:
         self.search_client = SearchClient(
             endpoint=self.search_endpoint,
             index_name=self.index_name,
-            credential=credential
+            credential=self._credential,
+            transport=self._transport,
         )
         
-        # Initialize Azure Chat OpenAI
-        self.llm = AzureChatOpenAI(
-            azure_deployment=self.chat_deployment,
-            openai_api_version=self.api_version,
-            azure_endpoint=self.azure_openai_endpoint,
-            api_key=self.azure_openai_key,
-            temperature=0.2
-        )
+        # The chat client is created on first use (see `llm`), so
+        # ingestion-only workers never build it
+        self._http_client = http_client
+        self._http_async_client = http_async_client
+        self._llm: Optional[AzureChatOpenAI] = None
+        self._llm_lock = Lock()
         
         # Get chunk settings from environment
         self.chunk_size = int(os.getenv("CHUNK_SIZE", "1000"))
@@ -117,19 +234,139 @@ class RAGIndexer:
             length_function=len,
         )
 
+        # "recursive" (fixed-size character chunks with overlap) or "semantic"
+        # (split where consecutive sentence embeddings diverge; no overlap)
+        self.chunk_strategy = os.getenv("CHUNK_STRATEGY", "recursive").lower()
+        self.semantic_chunker = None
+        if self.chunk_strategy == "semantic":
+            if SemanticChunker is None:
+                raise RuntimeError(
+                    "CHUNK_STRATEGY=semantic but langchain-experimental is not installed"
+                )
+            self.semantic_chunker = SemanticChunker(
+                self.embeddings, breakpoint_threshold_type="percentile"
+            )
+
+        # Recently embedded questions, so repeats skip the Azure OpenAI call
+        self.query_embedding_cache = QueryEmbeddingCache(
+            max_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2000")),
+            ttl_seconds=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "600")),
+        )
+
+    @property
+    def llm(self) -> AzureChatOpenAI:
+        """Azure Chat OpenAI client, created on first use."""
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    self._llm = AzureChatOpenAI(
+                        azure_deployment=self.chat_deployment,
+                        openai_api_version=self.api_version,
+                        azure_endpoint=self.azure_openai_endpoint,
+                        api_key=self.azure_openai_key,
+                        temperature=0.2,
+                        http_client=self._http_client,
+                        http_async_client=self._http_async_client,
+                    )
+        return self._llm
+
+    def _detect_vector_dimensions(self) -> int:
+        """
+        Determine the embedding dimension, skipping the billable probe when safe.
+        
+        The default index's dimension is trusted only when the embedding cache
+        recorded the same dimension for the current deployment. Otherwise (first
+        start, a changed deployment, or no cache) the deployment is probed, so
+        the index drift check still recreates an index built for other vectors.
+        """
+        index_dims = self._index_vector_dimensions(self.index_name)
+        known_dims = (
+            self.embedding_cache.get_dimension(self.embedding_deployment)
+            if self.embedding_cache is not None
+            else None
+        )
+        if index_dims and index_dims == known_dims:
+            logger.info(
+                "Using embedding dimension %s from existing index '%s'.",
+                index_dims,
+                self.index_name,
+            )
+            return index_dims
+
+        probe_embedding = self.embeddings.embed_query("dimension probe")
+        if not probe_embedding:
+            raise RuntimeError("Failed to detect embedding dimensions from Azure OpenAI.")
+        dims = len(probe_embedding)
+        logger.info(
+            "Detected embedding dimension %s from Azure OpenAI deployment '%s'.",
+            dims,
+            self.embedding_deployment,
+        )
+        if index_dims and index_dims != dims:
+            logger.warning(
+                "Embedding deployment '%s' returns %s dimensions but index '%s' has %s; "
+                "the index will be recreated.",
+                self.embedding_deployment,
+                dims,
+                self.index_name,
+                index_dims,
+            )
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_dimension(self.embedding_deployment, dims)
+        return dims
+
+    def _index_vector_dimensions(self, index_name: str) -> Optional[int]:
+        """Read the content vector dimension from an existing index, or None if it doesn't exist."""
+        try:
+            index = self.index_client.get_index(index_name)
+        except ResourceNotFoundError:
+            return None
+        for field in index.fields:
+            if field.name == "content_vector":
+                return field.vector_search_dimensions
+        return None
+
+    def _init_caches(self):
+        """Create the per-chat lookup caches."""
+        # Search clients per index name
+        self.search_clients: Dict[str, SearchClient] = {}
+        self._index_lock = Lock()  # serialises index check-and-create
+        # Upload batch size learned per index name
+        self._upload_batch_sizes: Dict[str, int] = {}
+        # OData filter strings per chat_id
+        self._filter_cache: Dict[str, str] = {}
         # Chat history storage per chat_id
-        self.chat_history: Dict[str, List[dict]] = {}
+        self.chat_history: Dict[str, Deque[dict]] = {}
+        # Formatted prompt history per chat, rebuilt after each new exchange
+        self._history_text: Dict[str, str] = {}
 
     @staticmethod
-    def _sanitize_document_id(filename: str, chunk_index: int) -> str:
+    def _create_search_transport() -> RequestsTransport:
         """
-        Azure AI Search document keys allow letters, digits, _, -, = only.
-        Replace other characters with underscores to keep IDs valid.
+        Build the pooled HTTP transport shared by all Azure Search clients.
+        The session is not owned by the transport, so closing one client
+        leaves the pool open for the others.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return RequestsTransport(
+            session=session,
+            session_owner=False,
+            connection_timeout=10,
+            read_timeout=30,
+        )
+
+    @staticmethod
+    def _document_id_prefix(filename: str) -> str:
+        """
+        Key prefix shared by every chunk of a file; chunk keys are
+        f"{prefix}_{chunk_index}". Azure AI Search document keys allow
+        letters, digits, _, -, = only, so other characters become underscores.
         """
         base_name = os.path.splitext(os.path.basename(filename))[0]
-        safe_base = re.sub(r"[^A-Za-z0-9_\-=]", "_", base_name)
-        safe_base = safe_base or "document"
-        return f"{safe_base}_{chunk_index}"
+        return _DOCUMENT_ID_INVALID.sub("_", base_name) or "document"
 
     @staticmethod
     def _sanitize_index_name(chat_name: str) -> str:
@@ -139,9 +376,9 @@ class RAGIndexer:
         Max length: 128 characters.
         """
         # Convert to lowercase and replace invalid characters with hyphens
-        sanitized = re.sub(r"[^a-z0-9\-]", "-", chat_name.lower())
+        sanitized = _INDEX_NAME_INVALID.sub("-", chat_name.lower())
         # Remove leading/trailing hyphens and consecutive hyphens
-        sanitized = re.sub(r"-+", "-", sanitized).strip("-")
+        sanitized = _HYPHEN_RUNS.sub("-", sanitized).strip("-")
         # Ensure it starts with a letter
         if not sanitized or not sanitized[0].isalpha():
             sanitized = f"chat-{sanitized}"
@@ -160,28 +397,49 @@ class RAGIndexer:
         index_name = self._get_index_name_for_chat(chat_name)
         
         # Return cached client if exists
-        if index_name in self.search_clients:
-            return self.search_clients[index_name]
-        
-        # Create index if doesn't exist
-        self._create_search_index_for_name(index_name)
-        
-        # Create and cache new search client
-        credential = AzureKeyCredential(self.search_key)
-        client = SearchClient(
-            endpoint=self.search_endpoint,
-            index_name=index_name,
-            credential=credential
-        )
-        self.search_clients[index_name] = client
+        client = self.search_clients.get(index_name)
+        if client is not None:
+            return client
+
+        # Concurrent retrievals and uploads for a new chat would otherwise all
+        # run the get_index/create_index check at once
+        with self._index_lock:
+            client = self.search_clients.get(index_name)
+            if client is not None:
+                return client
+
+            # Create index if doesn't exist
+            self._create_search_index_for_name(index_name)
+
+            # Create and cache new search client
+            client = SearchClient(
+                endpoint=self.search_endpoint,
+                index_name=index_name,
+                credential=self._credential,
+                transport=self._transport,
+            )
+            self.search_clients[index_name] = client
         return client
 
     @staticmethod
     def _escape_filter_value(value: str) -> str:
         """Escape single quotes for use in OData filters."""
         return value.replace("'", "''")
+
+    def _filter_for(self, chat_id: Optional[str]) -> Optional[str]:
+        """Return the memoized OData filter scoping a search to a chat (None for all chats)."""
+        if not chat_id:
+            return None
+        clause = self._filter_cache.get(chat_id)
+        if clause is None:
+            clause = f"chat_id eq '{self._escape_filter_value(chat_id)}'"
+            if len(self._filter_cache) >= FILTER_CACHE_MAX_ENTRIES:
+                self._filter_cache.pop(next(iter(self._filter_cache)), None)
+            self._filter_cache[chat_id] = clause
+        return clause
+
     def _validate_environment(self):
-        """Ensure all required Azure settings are present."""
+        """Ensure all required Azure settings are present and parse the HNSW settings."""
         required_vars = {
             "AZURE_SEARCH_ENDPOINT": self.search_endpoint,
             "AZURE_SEARCH_KEY": self.search_key,
@@ -198,6 +456,24 @@ class RAGIndexer:
                 "Missing required Azure environment variables: "
                 + ", ".join(missing)
             )
+
+        self.hnsw_parameters: Dict[str, int] = {}
+        invalid = []
+        for name, (parameter, default, low, high) in HNSW_SETTINGS.items():
+            raw = os.getenv(name, str(default))
+            try:
+                value = int(raw)
+            except ValueError:
+                invalid.append(f"{name}={raw!r} (not an integer)")
+                continue
+            if not low <= value <= high:
+                invalid.append(f"{name}={value} (allowed {low}-{high})")
+                continue
+            self.hnsw_parameters[parameter] = value
+        if invalid:
+            raise ValueError(
+                "Invalid HNSW settings for Azure AI Search: " + ", ".join(invalid)
+            )
     
     def _create_search_index_for_name(self, index_name: str):
         """Create Azure Search index with given name if it doesn't exist or fix schema drift."""
@@ -240,12 +516,7 @@ class RAGIndexer:
             algorithms=[
                 HnswAlgorithmConfiguration(
                     name="default-algo",
-                    parameters={
-                        "m": 4,
-                        "efConstruction": 400,
-                        "efSearch": 500,
-                        "metric": "cosine",
-                    },
+                    parameters={**self.hnsw_parameters, "metric": "cosine"},
                 )
             ],
             profiles=[
@@ -302,7 +573,12 @@ class RAGIndexer:
             logger.error("Failed to inspect index '%s': %s", index_name, exc)
             raise
 
-        self.index_client.create_index(index)
+        try:
+            self.index_client.create_index(index)
+        except ResourceExistsError:
+            # Another worker or instance created it between our check and create
+            logger.info("Index '%s' was created concurrently.", index_name)
+            return
         logger.info("Created index '%s' with vector search settings.", index_name)
     
     def process_document(self, file_path: str, filename: str, chat_id: str, chat_name: str = None) -> dict:
@@ -329,8 +605,9 @@ class RAGIndexer:
             # Use chat_name for index, fallback to chat_id if not provided
             index_key = chat_name if chat_name else chat_id
             
-            # Get or create chat-specific search client
+            # Make sure the chat-specific index (and its cached client) exists
             search_client = self._get_search_client_for_chat(index_key)
+            index_name = self._get_index_name_for_chat(index_key)
 
             # Extract text from the file
             text = extract_text_from_file(file_path)
@@ -342,20 +619,18 @@ class RAGIndexer:
                     "chunks": 0
                 }
             
-            # Create document and split into chunks
-            doc = Document(page_content=text, metadata={"source": filename})
-            chunks = self.text_splitter.split_documents([doc])
+            # Split into chunks
+            texts = self._split_text(text)
             
             # Prepare documents for Azure AI Search
-            if not chunks:
+            if not texts:
                 return {
                     "success": False,
                     "message": "No chunks were produced from this document.",
                     "chunks": 0,
                 }
             
-            texts = [chunk.page_content for chunk in chunks]
-            embeddings = self.embeddings.embed_documents(texts)
+            embeddings = self._embed_documents_cached(texts)
 
             if not embeddings:
                 return {
@@ -372,15 +647,16 @@ class RAGIndexer:
                     "Set VECTOR_DIMENSIONS to the correct value or recreate the index."
                 )
             
+            # Sanitize the per-file key prefix once rather than per chunk
+            id_prefix = self._document_id_prefix(f"{chat_id}_{filename}")
             documents = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                scoped_filename = f"{chat_id}_{filename}"
+            for i, (chunk, embedding) in enumerate(zip(texts, embeddings)):
                 documents.append(
                     {
-                        "id": self._sanitize_document_id(scoped_filename, i),
-                        "content": chunk.page_content,
+                        "id": f"{id_prefix}_{i}",
+                        "content": chunk,
                         "content_vector": embedding,
-                        "source": chunk.metadata.get("source", filename),
+                        "source": filename,
                         "chat_id": chat_id,
                     }
                 )
@@ -392,18 +668,20 @@ class RAGIndexer:
                     "chunks": 0,
                 }
             
-            upload_results = search_client.upload_documents(documents=documents)
-            failures = [r for r in upload_results if not getattr(r, "succeeded", True)]
-            if failures:
+            failure_count, first_failures = self._adaptive_upload(search_client, index_name, documents)
+            if failure_count:
+                failed_ids = ", ".join(first_failures)
                 raise RuntimeError(
-                    f"Failed to index {len(failures)} chunk(s). "
-                    f"First error: {getattr(failures[0], 'error_message', 'Unknown')}"
+                    f"Failed to index {failure_count} chunk(s) after retries. "
+                    f"First failed chunk ids: {failed_ids}"
                 )
             
             return {
                 "success": True,
                 "message": f"Successfully processed {filename} for chat {chat_id}",
-                "chunks": len(chunks)
+                "chunks": len(texts),
+                # Leading text, used to suggest likely questions for cache warm-up
+                "excerpt": "\n\n".join(texts[:3])[:EXCERPT_MAX_CHARS],
             }
             
         except (ValueError, IOError, RuntimeError) as e:
@@ -413,7 +691,178 @@ class RAGIndexer:
                 "chunks": 0
             }
     
-    def query(self, question: str, chat_id: str, chat_name: str = None) -> dict:
+    def _adaptive_upload(
+        self, search_client: SearchClient, index_name: str, documents: List[dict]
+    ) -> Tuple[int, List[str]]:
+        """
+        Upload documents in batches sized by a per-index controller.
+        
+        Throttling (whole-batch or per-document 503/429, 413 payload too large,
+        and the retryable 409/422 conflicts) halves the batch size, sleeps with
+        exponential backoff and resends the affected documents. Every
+        UPLOAD_GROWTH_STREAK clean batches grow it by 25% up to
+        UPLOAD_MAX_BATCH_SIZE, so the size settles near what the service
+        accepts and later uploads to the index start from there.
+        
+        This calls upload_documents directly rather than going through a
+        SearchIndexingBufferedSender: the sender retries throttled actions
+        internally and never surfaces the 503s the controller reacts to.
+        
+        Returns:
+            Number of documents that could not be indexed, and the ids of the
+            first MAX_REPORTED_FAILURES of them
+        """
+        batch_size = self._upload_batch_sizes.get(index_name, UPLOAD_INITIAL_BATCH_SIZE)
+        pending = deque(documents)
+        failure_count = 0
+        first_failures: List[str] = []
+        fail_streak = 0
+        success_streak = 0
+
+        while pending:
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            throttled = False
+            try:
+                results = search_client.upload_documents(documents=batch)
+            except HttpResponseError as exc:
+                if exc.status_code not in UPLOAD_RETRY_STATUSES:
+                    raise
+                throttled = True
+                pending.extendleft(reversed(batch))
+            else:
+                retry_keys = set()
+                for result in results:
+                    if result.succeeded:
+                        continue
+                    if result.status_code in UPLOAD_RETRY_STATUSES:
+                        retry_keys.add(result.key)
+                    else:
+                        failure_count += 1
+                        if len(first_failures) < MAX_REPORTED_FAILURES:
+                            first_failures.append(result.key)
+                if retry_keys:
+                    throttled = True
+                    pending.extendleft(reversed([doc for doc in batch if doc["id"] in retry_keys]))
+
+            if not throttled:
+                fail_streak = 0
+                success_streak += 1
+                if success_streak >= UPLOAD_GROWTH_STREAK:
+                    batch_size = min(UPLOAD_MAX_BATCH_SIZE, max(batch_size + 1, int(batch_size * 1.25)))
+                    success_streak = 0
+                continue
+
+            fail_streak += 1
+            success_streak = 0
+            if fail_streak > UPLOAD_MAX_RETRIES:
+                failure_count += len(pending)
+                first_failures.extend(
+                    doc["id"] for doc in islice(pending, MAX_REPORTED_FAILURES - len(first_failures))
+                )
+                break
+            batch_size = max(1, batch_size // 2)
+            delay = min(30, 2 ** fail_streak)
+            logger.warning(
+                "Indexing throttled for '%s'; retrying with batch size %d in %ds.",
+                index_name, batch_size, delay,
+            )
+            time.sleep(delay)
+
+        self._upload_batch_sizes[index_name] = batch_size
+        return failure_count, first_failures
+
+    def _split_text(self, text: str) -> List[str]:
+        """
+        Split document text into chunks. Semantic chunking embeds sentences, so
+        it runs inline; large texts are otherwise split in the process pool.
+        """
+        if self.semantic_chunker is not None:
+            return self.semantic_chunker.split_text(text)
+        if len(text) < SPLIT_PARALLEL_MIN_CHARS:
+            return self.text_splitter.split_text(text)
+        return split_text_in_pool(text, self.chunk_size, self.chunk_overlap)
+
+    def _embed_documents_cached(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed chunk texts, reusing vectors from the persistent content-hash
+        cache and embedding only the chunks not seen before.
+        """
+        if self.embedding_cache is None:
+            return self._embed_documents_parallel(texts)
+
+        hashes = [EmbeddingCache.key_for(self.embedding_deployment, text) for text in texts]
+        cached = self.embedding_cache.get_many(hashes)
+        missing_idx = [i for i, key in enumerate(hashes) if key not in cached]
+        if missing_idx:
+            fresh = self._embed_documents_parallel([texts[i] for i in missing_idx])
+            self.embedding_cache.put_many(
+                (hashes[i], vector) for i, vector in zip(missing_idx, fresh)
+            )
+            cached.update((hashes[i], vector) for i, vector in zip(missing_idx, fresh))
+        if len(missing_idx) < len(texts):
+            logger.info(
+                "Reused %d of %d chunk embeddings from cache.",
+                len(texts) - len(missing_idx),
+                len(texts),
+            )
+        return [cached[key] for key in hashes]
+
+    def _embed_documents_parallel(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed chunk texts in fixed-size sub-batches dispatched concurrently,
+        so network round-trips overlap instead of queueing behind one request.
+        Results keep the order of `texts`.
+        """
+        batches = [
+            texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
+        if len(batches) <= 1:
+            return self._embed_batch_with_backoff(texts)
+
+        embeddings: List[List[float]] = []
+        for batch_embeddings in _embedding_executor.map(self._embed_batch_with_backoff, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _embed_batch_with_backoff(self, batch: List[str]) -> List[List[float]]:
+        """Embed one sub-batch, retrying Azure OpenAI rate limits with jittered backoff."""
+        for attempt in range(EMBED_MAX_RETRIES):
+            try:
+                return self.embeddings.embed_documents(batch)
+            except RateLimitError:
+                if attempt == EMBED_MAX_RETRIES - 1:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logger.warning("Embedding rate limited; retrying in %.1fs.", delay)
+                time.sleep(delay)
+        return []
+
+    def embed_query(self, question: str) -> np.ndarray:
+        """
+        Embed a question with the indexer's Azure OpenAI embedding deployment.
+        
+        Args:
+            question: Text to embed
+            
+        Returns:
+            L2-normalized float32 embedding vector
+        """
+        return self._cached_embed_query(question)
+
+    def _cached_embed_query(self, question: str) -> np.ndarray:
+        """Embed a question, reusing a cached vector for a recently seen identical question."""
+        vector = self.query_embedding_cache.get(question)
+        if vector is None:
+            vector = self.query_embedding_cache.put(question, self.embeddings.embed_query(question))
+        return vector
+
+    def query(
+        self,
+        question: str,
+        chat_id: str,
+        chat_name: str = None,
+        question_vector: Optional[np.ndarray] = None,
+    ) -> dict:
         """
         Query the RAG system with a question.
         
@@ -421,6 +870,7 @@ class RAGIndexer:
             question: User's question
             chat_id: Chat session identifier
             chat_name: Chat name for index lookup (optional, defaults to chat_id)
+            question_vector: Precomputed question embedding (optional)
             
         Returns:
             Dictionary with answer and source information
@@ -433,90 +883,19 @@ class RAGIndexer:
                     "sources": [],
                 }
 
-            # Use chat_name for index, fallback to chat_id if not provided
-            index_key = chat_name if chat_name else chat_id
-            
-            # Get chat-specific search client
-            search_client = self._get_search_client_for_chat(index_key)
-
-            # Generate embedding for the question
-            question_vector = self.embeddings.embed_query(question)
-            
-            # Perform vector search using the correct Azure Search syntax
-            vector_query = VectorizedQuery(
-                vector=question_vector,
-                k_nearest_neighbors=3,
-                fields="content_vector"
-            )
-            
-            filter_value = self._escape_filter_value(chat_id)
-            search_results = search_client.search(
-                search_text=None,
-                vector_queries=[vector_query],
-                select=["content", "source"],
-                filter=f"chat_id eq '{filter_value}'",
-            )
+            # Generate embedding for the question unless the caller already did
+            if question_vector is None:
+                question_vector = self.embed_query(question)
             
-            # Extract relevant documents
-            relevant_docs = []
-            sources = []
-            for result in search_results:
-                relevant_docs.append(result["content"])
-                sources.append({
-                    "content": result["content"][:200] + "...",
-                    "source": result.get("source", "Unknown")
-                })
+            relevant_docs, sources = self._retrieve(question_vector, chat_id, chat_name)
             
             if not relevant_docs:
-                return {
-                    "success": True,
-                    "answer": "I couldn't find any relevant information in the uploaded documents to answer your question.",
-                    "sources": []
-                }
+                return self._no_results()
             
-            # Format context from retrieved documents
-            context = "\n\n".join(relevant_docs)
+            rag_chain = RAG_PROMPT | self.llm | StrOutputParser()
+            answer = rag_chain.invoke(self._prompt_inputs(question, chat_id, relevant_docs))
             
-            # Format chat history
-            history = self.chat_history.get(chat_id, [])
-            history_text = ""
-            if history:
-                history_text = "\n".join([
-                    f"Human: {h['question']}\nAssistant: {h['answer']}"
-                    for h in history[-3:]  # Last 3 exchanges
-                ])
-            
-            # Create prompt
-            prompt_template = """You are a helpful AI assistant. Use the following context from documents to answer the question. If you cannot find the answer in the context, say so.
-
-Chat History:
-{history}
-
-Context from documents:
-{context}
-
-Question: {question}
-
-Answer:"""
-            
-            prompt = ChatPromptTemplate.from_template(prompt_template)
-            
-            rag_chain = prompt | self.llm | StrOutputParser()
-            
-            answer = rag_chain.invoke(
-                {
-                    "context": context,
-                    "question": question,
-                    "history": history_text,
-                }
-            )
-            
-            # Store in chat history
-            history.append({
-                "question": question,
-                "answer": answer
-            })
-            self.chat_history[chat_id] = history
+            self._record_history(chat_id, question, answer)
             
             return {
                 "success": True,
@@ -530,6 +909,253 @@ Answer:"""
                 "answer": f"Error processing query: {str(e)}",
                 "sources": []
             }
+
+    async def aembed_query(self, question: str) -> np.ndarray:
+        """Async counterpart of embed_query, sharing its cache."""
+        vector = self.query_embedding_cache.get(question)
+        if vector is None:
+            embedded = await self.embeddings.aembed_query(question)
+            vector = self.query_embedding_cache.put(question, embedded)
+        return vector
+
+    async def astream_query(
+        self,
+        question: str,
+        chat_id: str,
+        chat_name: str = None,
+        question_vector: Optional[np.ndarray] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Answer a question, streaming tokens as the LLM produces them.
+        
+        Args:
+            question: User's question
+            chat_id: Chat session identifier
+            chat_name: Chat name for index lookup (optional, defaults to chat_id)
+            question_vector: Precomputed question embedding (optional)
+            
+        Yields:
+            {"type": "sources", "sources": [...]} once retrieval finishes, then
+            {"type": "token", "token": str} per generated chunk, and finally
+            {"type": "done", "success": bool, "answer": str} with the full answer
+        """
+        try:
+            if not chat_id.strip():
+                yield {"type": "done", "success": False, "answer": "chat_id is required to perform a query."}
+                return
+
+            if question_vector is None:
+                question_vector = await self.aembed_query(question)
+
+            # The sync search client shares the pooled transport and per-chat
+            # client cache; run it off the event loop
+            relevant_docs, sources = await asyncio.to_thread(
+                self._retrieve, question_vector, chat_id, chat_name
+            )
+            yield {"type": "sources", "sources": sources}
+
+            if not relevant_docs:
+                yield {"type": "done", "success": True, "answer": self._no_results()["answer"]}
+                return
+
+            rag_chain = RAG_PROMPT | self.llm | StrOutputParser()
+            parts = []
+            async for token in rag_chain.astream(self._prompt_inputs(question, chat_id, relevant_docs)):
+                parts.append(token)
+                yield {"type": "token", "token": token}
+
+            answer = "".join(parts)
+            self._record_history(chat_id, question, answer)
+            yield {"type": "done", "success": True, "answer": answer}
+
+        except Exception as e:  # Azure/OpenAI/httpx errors too; the stream must always end with "done"
+            logger.exception("Streaming query failed for chat %s", chat_id)
+            yield {"type": "done", "success": False, "answer": f"Error processing query: {str(e)}"}
+
+    def query_batch(self, requests: List[tuple], record_history: bool = True) -> List[dict]:
+        """
+        Answer several questions together, amortising the remote calls.
+        
+        Missing question embeddings are fetched in one embedding request,
+        retrievals run concurrently and the LLM calls go through one chain batch.
+        
+        Args:
+            requests: (question, chat_id, chat_name, question_vector) tuples;
+                question_vector may be None
+            record_history: Whether answers are added to the chats' history
+            
+        Returns:
+            One result dictionary per request, in order, shaped like query()
+        """
+        results: List[Optional[dict]] = [None] * len(requests)
+        
+        missing = [i for i, request in enumerate(requests) if request[3] is None]
+        vectors = [request[3] for request in requests]
+        if missing:
+            try:
+                embedded = self.embed_questions([requests[i][0] for i in missing])
+            except Exception as e:  # fall back to per-question embedding below
+                logger.warning("Batched question embedding failed: %s", e)
+                embedded = [None] * len(missing)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        
+        def retrieve(i: int):
+            question, chat_id, chat_name, _ = requests[i]
+            if not chat_id.strip():
+                raise ValueError("chat_id is required to perform a query.")
+            vector = vectors[i]
+            if vector is None:
+                vector = self.embed_query(question)
+            return self._retrieve(vector, chat_id, chat_name)
+        
+        # Any exception is reported on its own request so one failing chat or
+        # question doesn't fail the rest of the batch
+        futures = [_retrieval_executor.submit(retrieve, i) for i in range(len(requests))]
+        
+        pending = []
+        for i, future in enumerate(futures):
+            try:
+                relevant_docs, sources = future.result()
+            except Exception as e:
+                results[i] = {
+                    "success": False,
+                    "answer": f"Error processing query: {str(e)}",
+                    "sources": [],
+                }
+                continue
+            if not relevant_docs:
+                results[i] = self._no_results()
+                continue
+            pending.append((i, relevant_docs, sources))
+        
+        if pending:
+            rag_chain = RAG_PROMPT | self.llm | StrOutputParser()
+            answers = rag_chain.batch(
+                [
+                    self._prompt_inputs(requests[i][0], requests[i][1], relevant_docs)
+                    for i, relevant_docs, _ in pending
+                ],
+                return_exceptions=True,
+            )
+            for (i, _, sources), answer in zip(pending, answers):
+                if isinstance(answer, Exception):
+                    results[i] = {
+                        "success": False,
+                        "answer": f"Error processing query: {str(answer)}",
+                        "sources": [],
+                    }
+                    continue
+                if record_history:
+                    question, chat_id = requests[i][0], requests[i][1]
+                    self._record_history(chat_id, question, answer)
+                results[i] = {
+                    "success": True,
+                    "answer": answer,
+                    "sources": sources,
+                }
+        
+        return results
+
+    def embed_questions(self, questions: List[str]) -> List[np.ndarray]:
+        """Embed several questions, fetching uncached ones in a single Azure OpenAI request."""
+        vectors = [self.query_embedding_cache.get(question) for question in questions]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([questions[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = self.query_embedding_cache.put(questions[i], vector)
+        return vectors
+
+    def suggest_questions(self, excerpt: str, count: int) -> List[str]:
+        """
+        Ask the LLM for questions a user is likely to ask about a document.
+        
+        Args:
+            excerpt: Leading text of the document
+            count: Number of questions to generate
+            
+        Returns:
+            Up to `count` questions, one per generated line
+        """
+        if not excerpt.strip() or count <= 0:
+            return []
+        chain = SUGGEST_QUESTIONS_PROMPT | self.llm | StrOutputParser()
+        output = chain.invoke({"excerpt": excerpt, "count": count})
+        questions = [line.strip().lstrip("-*0123456789.) ").strip() for line in output.splitlines()]
+        return [q for q in questions if q][:count]
+
+    def _retrieve(
+        self, question_vector: np.ndarray, chat_id: str, chat_name: Optional[str]
+    ) -> Tuple[List[str], List[dict]]:
+        """Run the chat-scoped vector search and return contents plus source previews."""
+        # Use chat_name for index, fallback to chat_id if not provided
+        index_key = chat_name if chat_name else chat_id
+        
+        # Get chat-specific search client
+        search_client = self._get_search_client_for_chat(index_key)
+        
+        # Perform vector search using the correct Azure Search syntax; the SDK
+        # serializes plain floats, so convert only here
+        vector_query = VectorizedQuery(
+            vector=np.asarray(question_vector, dtype=np.float32).tolist(),
+            k_nearest_neighbors=3,
+            fields="content_vector"
+        )
+        
+        search_results = search_client.search(
+            search_text=None,
+            vector_queries=[vector_query],
+            select=["content", "source"],
+            filter=self._filter_for(chat_id),
+        )
+        
+        # Extract relevant documents
+        relevant_docs = []
+        sources = []
+        for result in search_results:
+            relevant_docs.append(result["content"])
+            sources.append({
+                "content": result["content"][:200] + "...",
+                "source": result.get("source", "Unknown")
+            })
+        return relevant_docs, sources
+
+    @staticmethod
+    def _no_results() -> dict:
+        return {
+            "success": True,
+            "answer": "I couldn't find any relevant information in the uploaded documents to answer your question.",
+            "sources": []
+        }
+
+    def _prompt_inputs(self, question: str, chat_id: str, relevant_docs: List[str]) -> dict:
+        """Build the RAG prompt variables from retrieved context and chat history."""
+        history_text = self._history_text.get(chat_id)
+        if history_text is None:
+            history = self.chat_history.get(chat_id, ())
+            recent = list(islice(reversed(history), PROMPT_HISTORY_TURNS))[::-1]
+            history_text = "\n".join(
+                f"Human: {h['question']}\nAssistant: {h['answer']}" for h in recent
+            )
+            self._history_text[chat_id] = history_text
+
+        return {
+            "context": "\n\n".join(relevant_docs),
+            "question": question,
+            "history": history_text,
+        }
+
+    def _record_history(self, chat_id: str, question: str, answer: str):
+        """Store an exchange in the chat history."""
+        history = self.chat_history.get(chat_id)
+        if history is None:
+            history = self.chat_history.setdefault(chat_id, deque(maxlen=MAX_HISTORY))
+        history.append({
+            "question": question,
+            "answer": answer
+        })
+        self._history_text.pop(chat_id, None)
     
     def reset(self, chat_id: Optional[str] = None) -> dict:
         """
@@ -537,6 +1163,8 @@ Answer:"""
         """
         if chat_id:
             self.chat_history.pop(chat_id, None)
+            self._history_text.pop(chat_id, None)
+            self._filter_cache.pop(chat_id, None)
             deleted = self._delete_documents(chat_id)
             return {
                 "success": True,
@@ -544,6 +1172,9 @@ Answer:"""
             }
 
         self.chat_history = {}
+        self._history_text = {}
+        self._filter_cache = {}
+        self.query_embedding_cache.clear()
         deleted = self._delete_documents(None)
         return {
             "success": True,
@@ -569,37 +1200,72 @@ Answer:"""
     def _chat_has_documents(self, chat_id: Optional[str]) -> bool:
         """Determine whether any documents exist for the chat (or globally if None)."""
         try:
-            filter_clause = None
-            if chat_id:
-                filter_clause = f"chat_id eq '{self._escape_filter_value(chat_id)}'"
+            filter_clause = self._filter_for(chat_id)
             results = self.search_client.search(
                 search_text="*",
                 filter=filter_clause,
-                select=["id"],
-                top=1,
+                top=0,
+                include_total_count=True,
             )
-            return any(results)
+            return (results.get_count() or 0) > 0
         except (ValueError, RuntimeError) as exc:
             logger.warning("Error checking status: %s", exc)
             return False
 
     def _delete_documents(self, chat_id: Optional[str]) -> int:
         """Delete all documents for a chat (or globally if chat_id is None)."""
-        filter_clause = None
-        if chat_id:
-            filter_clause = f"chat_id eq '{self._escape_filter_value(chat_id)}'"
+        deleted = 0
+        # Only the previous pass's deletions can still be visible to search;
+        # failed keys are left out so the next pass retries them.
+        recently_deleted: Set[str] = set()
+        for _ in range(DELETE_MAX_PASSES):
+            futures = [
+                _delete_executor.submit(self._delete_batch_with_backoff, batch)
+                for batch in self._iter_document_id_batches(chat_id, recently_deleted)
+            ]
+            if not futures:
+                break
+            recently_deleted = set().union(*(future.result() for future in futures))
+            deleted += len(recently_deleted)
+        return deleted
 
+    def _iter_document_id_batches(self, chat_id: Optional[str], skip: Set[str]):
+        """
+        Yield document keys matching the chat page by page, in delete-sized batches.
+        Keys in `skip` (deleted by the previous pass but possibly still
+        visible to search) are left out.
+        """
         results = self.search_client.search(
             search_text="*",
-            filter=filter_clause,
+            filter=self._filter_for(chat_id),
             select=["id"],
         )
+        batch = []
+        for doc in results:
+            if doc["id"] in skip:
+                continue
+            batch.append({"id": doc["id"]})
+            if len(batch) == DELETE_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
-        ids = [{"id": doc["id"]} for doc in results]
-        deleted = 0
-        while ids:
-            batch = ids[:1000]
-            self.search_client.delete_documents(documents=batch)
-            deleted += len(batch)
-            ids = ids[1000:]
-        return deleted
+    def _delete_batch_with_backoff(self, batch: List[dict]) -> Set[str]:
+        """
+        Delete one batch, retrying Azure Search throttling with jittered backoff.
+
+        Returns:
+            Keys whose delete succeeded
+        """
+        for attempt in range(DELETE_MAX_RETRIES):
+            try:
+                results = self.search_client.delete_documents(documents=batch)
+                return {result.key for result in results if result.succeeded}
+            except HttpResponseError as exc:
+                if exc.status_code not in (429, 503) or attempt == DELETE_MAX_RETRIES - 1:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logger.warning("Delete throttled (%s); retrying in %.1fs.", exc.status_code, delay)
+                time.sleep(delay)
+        return set()
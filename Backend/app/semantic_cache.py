@@ -0,0 +1,351 @@
+"""
+Semantic answer caches: a Redis vector index, or an in-process int8 matrix
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from threading import Lock
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger("semantic-cache")
+
+# Redis is optional; the Redis cache is disabled without it. A redis package
+# without the search commands (too old a version) is reported separately.
+_redis_import_error: Optional[str] = None
+try:
+    import redis
+except ImportError:
+    redis = None
+    _redis_import_error = "the 'redis' package is not installed"
+else:
+    try:
+        from redis.commands.search.field import TagField, TextField, VectorField
+        from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+        from redis.commands.search.query import Query
+        from redis.exceptions import RedisError, ResponseError
+    except ImportError as exc:
+        redis = None
+        _redis_import_error = f"the installed 'redis' package lacks RediSearch support ({exc})"
+
+class SemanticCache:
+    """
+    Caches RAG answers keyed by question embedding, scoped per chat.
+
+    A lookup returns the stored answer of the nearest cached question for the
+    same chat when its cosine similarity reaches the configured threshold.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        vector_dimensions: int,
+        threshold: float = 0.92,
+        ttl_seconds: int = 3600,
+        index_name: str = "semantic-cache-v2",
+    ):
+        """
+        Connect to Redis and create the vector index if it doesn't exist.
+
+        Args:
+            redis_url: Redis connection URL (Redis Stack / RediSearch required)
+            vector_dimensions: Dimension of the question embeddings
+            threshold: Minimum cosine similarity for a cache hit
+            ttl_seconds: Expiry of cached entries
+            index_name: Name of the RediSearch index (v2 keys entries by a
+                hash of the chat_id; v1 indexes are not reused)
+        """
+        self.client = redis.Redis.from_url(redis_url)
+        self.vector_dimensions = vector_dimensions
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.index_name = index_name
+        self.key_prefix = f"{index_name}:"
+        self._create_index()
+
+    @classmethod
+    def from_env(
+        cls, vector_dimensions: int
+    ) -> Optional[Union["SemanticCache", "LocalSemanticCache"]]:
+        """
+        Build a cache from environment variables.
+
+        Uses Redis when REDIS_URL is set and reachable. Otherwise falls back to
+        an in-process LocalSemanticCache if SEMANTIC_CACHE_LOCAL_SIZE > 0, and
+        returns None when neither is available so callers can treat the cache
+        as optional.
+        """
+        threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        ttl_seconds = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url and redis is None:
+            logger.warning("REDIS_URL is set but %s; Redis semantic cache disabled.", _redis_import_error)
+        elif redis_url:
+            try:
+                return cls(redis_url, vector_dimensions, threshold=threshold, ttl_seconds=ttl_seconds)
+            except (RedisError, ValueError) as exc:  # ValueError: malformed REDIS_URL
+                logger.warning("Semantic cache unavailable: %s", exc)
+
+        local_size = int(os.getenv("SEMANTIC_CACHE_LOCAL_SIZE", "0"))
+        if local_size <= 0:
+            return None
+        logger.info("Using in-process semantic cache (%d entries).", local_size)
+        return LocalSemanticCache(
+            vector_dimensions, threshold=threshold, ttl_seconds=ttl_seconds, capacity=local_size
+        )
+
+    def _create_index(self):
+        """Create the RediSearch HNSW index for cached questions."""
+        try:
+            self.client.ft(self.index_name).info()
+            return
+        except ResponseError:
+            pass
+
+        self.client.ft(self.index_name).create_index(
+            fields=[
+                TagField("chat_key"),
+                TextField("question"),
+                VectorField(
+                    "vector",
+                    "HNSW",
+                    {
+                        "TYPE": "FLOAT32",
+                        "DIM": self.vector_dimensions,
+                        "DISTANCE_METRIC": "COSINE",
+                    },
+                ),
+            ],
+            definition=IndexDefinition(prefix=[self.key_prefix], index_type=IndexType.HASH),
+        )
+        logger.info("Created semantic cache index '%s'.", self.index_name)
+
+    @staticmethod
+    def _to_bytes(vector: np.ndarray) -> bytes:
+        """Pack an embedding as FLOAT32 bytes for Redis."""
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def _chat_key(chat_id: str) -> str:
+        """
+        Hash a chat_id into a tag and key segment. Raw ids could contain tag
+        separators (",") or glob/key delimiters and match other chats.
+        """
+        return hashlib.sha256(chat_id.encode("utf-8")).hexdigest()[:32]
+
+    def lookup(self, chat_id: str, vector: np.ndarray) -> Optional[dict]:
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            chat_id: Chat session identifier
+            vector: Embedding of the incoming question
+
+        Returns:
+            Dictionary with answer and sources on a hit, otherwise None
+        """
+        query = (
+            Query(f"(@chat_key:{{{self._chat_key(chat_id)}}})=>[KNN 1 @vector $vec AS distance]")
+            .return_fields("answer", "sources", "distance")
+            .dialect(2)
+        )
+        try:
+            results = self.client.ft(self.index_name).search(
+                query, query_params={"vec": self._to_bytes(vector)}
+            )
+        except RedisError as exc:
+            logger.warning("Semantic cache lookup failed: %s", exc)
+            return None
+
+        if not results.docs:
+            return None
+
+        hit = results.docs[0]
+        similarity = 1.0 - float(hit.distance)
+        if similarity < self.threshold:
+            return None
+
+        return {
+            "success": True,
+            "answer": hit.answer,
+            "sources": json.loads(hit.sources),
+        }
+
+    def store(self, chat_id: str, question: str, vector: np.ndarray, result: dict):
+        """
+        Cache an answer under its question embedding.
+
+        Args:
+            chat_id: Chat session identifier
+            question: Original question text
+            vector: Embedding of the question
+            result: Indexer result with answer and sources
+        """
+        chat_key = self._chat_key(chat_id)
+        key = f"{self.key_prefix}{chat_key}:{uuid.uuid4().hex}"
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(
+                key,
+                mapping={
+                    "chat_key": chat_key,
+                    "chat_id": chat_id,
+                    "question": question,
+                    "answer": result["answer"],
+                    "sources": json.dumps(result["sources"]),
+                    "vector": self._to_bytes(vector),
+                },
+            )
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except RedisError as exc:
+            logger.warning("Semantic cache store failed: %s", exc)
+
+    def clear(self, chat_id: Optional[str] = None) -> int:
+        """Remove cached answers for a chat (or all chats if chat_id is None)."""
+        scope = self._chat_key(chat_id) + ":" if chat_id else ""
+        deleted = 0
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.key_prefix}{scope}*", count=500))
+            for start in range(0, len(keys), 500):
+                deleted += self.client.delete(*keys[start:start + 500])
+        except RedisError as exc:
+            logger.warning("Semantic cache clear failed: %s", exc)
+        return deleted
+
+
+class LocalSemanticCache:
+    """
+    In-process semantic answer cache with the same interface as SemanticCache.
+
+    Question vectors are L2-normalized and quantized to int8 with a per-vector
+    scale, stored in one contiguous (capacity, dimensions) matrix. Cosine
+    similarity is then an integer dot product times the two scales. Entries
+    are evicted oldest-first once the ring buffer is full. The cache is local
+    to each worker process.
+    """
+
+    def __init__(
+        self,
+        vector_dimensions: int,
+        threshold: float = 0.92,
+        ttl_seconds: int = 3600,
+        capacity: int = 10000,
+    ):
+        """
+        Args:
+            vector_dimensions: Dimension of the question embeddings
+            threshold: Minimum cosine similarity for a cache hit
+            ttl_seconds: Expiry of cached entries
+            capacity: Maximum number of cached answers
+        """
+        self.vector_dimensions = vector_dimensions
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self._matrix = np.zeros((capacity, vector_dimensions), dtype=np.int8)
+        self._scales = np.zeros(capacity, dtype=np.float32)
+        self._stored_at = np.zeros(capacity, dtype=np.float64)
+        # Small integer code per chat so the chat filter is a vectorized compare; -1 marks a free slot
+        self._chat_codes = np.full(capacity, -1, dtype=np.int32)
+        self._codes: Dict[str, int] = {}
+        self._next_code = 0
+        self._results: List[Optional[dict]] = [None] * capacity
+        self._next = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def _quantize(vector: np.ndarray):
+        """Quantize a vector to int8, returning the int8 vector and its scale."""
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec = vec / norm
+        peak = float(np.abs(vec).max()) if vec.size else 0.0
+        if peak == 0:
+            return np.zeros(vec.shape, dtype=np.int8), 0.0
+        scale = peak / 127.0
+        return np.round(vec / scale).astype(np.int8), scale
+
+    def lookup(self, chat_id: str, vector: np.ndarray) -> Optional[dict]:
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            chat_id: Chat session identifier
+            vector: Embedding of the incoming question
+
+        Returns:
+            Dictionary with answer and sources on a hit, otherwise None
+        """
+        query, query_scale = self._quantize(vector)
+        with self._lock:
+            code = self._codes.get(chat_id)
+            if code is None:
+                return None
+            live = (self._chat_codes == code) & (
+                self._stored_at >= time.monotonic() - self.ttl_seconds
+            )
+            rows = np.flatnonzero(live)
+            if rows.size == 0:
+                return None
+            dots = self._matrix[rows].astype(np.int32) @ query.astype(np.int32)
+            similarities = dots * self._scales[rows] * query_scale
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            result = self._results[rows[best]]
+        return {
+            "success": True,
+            "answer": result["answer"],
+            "sources": list(result["sources"]),
+        }
+
+    def store(self, chat_id: str, question: str, vector: np.ndarray, result: dict):
+        """
+        Cache an answer under its question embedding.
+
+        Args:
+            chat_id: Chat session identifier
+            question: Original question text
+            vector: Embedding of the question
+            result: Indexer result with answer and sources
+        """
+        quantized, scale = self._quantize(vector)
+        with self._lock:
+            code = self._codes.get(chat_id)
+            if code is None:
+                code = self._codes[chat_id] = self._next_code
+                self._next_code += 1
+            slot = self._next
+            self._matrix[slot] = quantized
+            self._scales[slot] = scale
+            self._stored_at[slot] = time.monotonic()
+            self._chat_codes[slot] = code
+            self._results[slot] = {
+                "question": question,
+                "answer": result["answer"],
+                "sources": list(result["sources"]),
+            }
+            self._next = (slot + 1) % self.capacity
+
+    def clear(self, chat_id: Optional[str] = None) -> int:
+        """Remove cached answers for a chat (or all chats if chat_id is None)."""
+        with self._lock:
+            if chat_id is None:
+                rows = np.flatnonzero(self._chat_codes >= 0)
+                self._codes.clear()
+            else:
+                code = self._codes.pop(chat_id, None)
+                if code is None:
+                    return 0
+                rows = np.flatnonzero(self._chat_codes == code)
+            self._chat_codes[rows] = -1
+            for row in rows:
+                self._results[row] = None
+            return int(rows.size)
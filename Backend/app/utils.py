@@ -1,16 +1,93 @@
 """
 Utility functions for the RAG chatbot
 """
+import multiprocessing
 import os
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import List, Optional, Tuple
 from pypdf import PdfReader
 from docx import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    import fitz  # PyMuPDF: optional, much faster native PDF text extraction
+except ImportError:
+    fitz = None
+
+# PDF backend: "auto" (PyMuPDF when installed), "pymupdf" or "pypdf"
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto").lower()
+
+# PDFs with at least this many pages are extracted in a process pool, and
+# texts with at least this many characters are chunked there
+PDF_PARALLEL_MIN_PAGES = 8
+SPLIT_PARALLEL_MIN_CHARS = 50_000
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = Lock()
+
+
+def _extract_pdf_page_range(args: Tuple[str, int, int]) -> List[str]:
+    """
+    Extract text from pages [start, stop) of a PDF. Runs in a worker process,
+    so it opens its own reader.
+    """
+    file_path, start, stop = args
+    reader = PdfReader(file_path, strict=False)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool used for large PDFs and texts."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _reset_process_pool(broken: ProcessPoolExecutor):
+    """
+    Drop a pool whose worker died (OOM, segfault) so the next call builds a
+    fresh one; a broken pool refuses all further work.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken:
+            _process_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _use_pymupdf() -> bool:
+    if PDF_BACKEND == "pypdf":
+        return False
+    if fitz is None:
+        if PDF_BACKEND == "pymupdf":
+            raise RuntimeError("PDF_BACKEND=pymupdf but PyMuPDF is not installed")
+        return False
+    return True
+
+
+def _extract_pdf_pymupdf(file_path: str) -> str:
+    """Extract PDF text with MuPDF's native text extraction."""
+    with fitz.open(file_path) as doc:
+        return "\n".join(page.get_text("text") for page in doc)
 
 
 def extract_text_from_pdf(file_path: str) -> str:
     """
     Extract text content from a PDF file.
     
+    Uses PyMuPDF when available (see PDF_BACKEND). With pypdf, page text
+    extraction is CPU-bound pure Python, so PDFs with at least
+    PDF_PARALLEL_MIN_PAGES pages are split into page ranges and extracted
+    in a process pool; smaller ones stay serial to avoid IPC overhead. If a
+    pool worker dies, the pool is replaced and the file is extracted serially.
+    
     Args:
         file_path: Path to the PDF file
         
@@ -18,11 +95,29 @@ def extract_text_from_pdf(file_path: str) -> str:
         Extracted text as a string
     """
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        if _use_pymupdf():
+            return _extract_pdf_pymupdf(file_path)
+
+        reader = PdfReader(file_path, strict=False)
+        page_count = len(reader.pages)
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+            parts = [page.extract_text() or "" for page in reader.pages]
+            return "\n".join(parts)
+
+        step = -(-page_count // PDF_WORKERS)  # ceil division
+        ranges = [
+            (file_path, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        pool = _get_process_pool()
+        try:
+            parts = []
+            for range_parts in pool.map(_extract_pdf_page_range, ranges):
+                parts.extend(range_parts)
+        except BrokenProcessPool:
+            _reset_process_pool(pool)
+            parts = [page.extract_text() or "" for page in reader.pages]
+        return "\n".join(parts)
     except Exception as e:
         raise RuntimeError(f"Error extracting text from PDF: {str(e)}") from e
 
@@ -39,10 +134,7 @@ def extract_text_from_docx(file_path: str) -> str:
     """
     try:
         doc = Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return "\n".join(paragraph.text for paragraph in doc.paragraphs)
     except Exception as e:
         raise RuntimeError(f"Error extracting text from DOCX: {str(e)}") from e
 
@@ -86,6 +178,42 @@ def extract_text_from_file(file_path: str) -> str:
         raise ValueError(f"Unsupported file format: {extension}")
 
 
+def _split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Split text into overlapping chunks. Runs in a worker process."""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+    return splitter.split_text(text)
+
+
+def split_text_in_pool(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Split a large text into chunks in the shared process pool.
+    
+    Recursive character splitting is pure Python and holds the GIL, so
+    running it in a worker process keeps the web worker responsive while a
+    large document is ingested. Callers should split small texts inline.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared between consecutive chunks
+        
+    Returns:
+        Chunk texts in document order
+    """
+    if PDF_WORKERS < 2:
+        return _split_text(text, chunk_size, chunk_overlap)
+    pool = _get_process_pool()
+    try:
+        return pool.submit(_split_text, text, chunk_size, chunk_overlap).result()
+    except BrokenProcessPool:
+        _reset_process_pool(pool)
+        return _split_text(text, chunk_size, chunk_overlap)
+
+
 def format_docs(docs: List) -> str:
     """
     Format a list of documents into a single string.
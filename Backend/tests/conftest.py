@@ -0,0 +1,8 @@
+"""
+Shared pytest setup: the backend modules import each other as top-level
+modules (e.g. `from utils import ...`), so put Backend/app on sys.path.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,92 @@
+"""
+Tests for the adaptive batch-size controller used to index chunks
+"""
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+import rag_indexer
+from rag_indexer import RAGIndexer
+
+
+def _error(status_code: int) -> HttpResponseError:
+    error = HttpResponseError(message=f"HTTP {status_code}")
+    error.status_code = status_code
+    return error
+
+
+class FakeSearchClient:
+    """Records batch sizes; `script` yields per-call behaviour (exception or {id: status})."""
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.batches = []
+
+    def upload_documents(self, documents):
+        self.batches.append([doc["id"] for doc in documents])
+        step = self.script.pop(0) if self.script else {}
+        if isinstance(step, Exception):
+            raise step
+        return [
+            SimpleNamespace(
+                key=doc["id"],
+                succeeded=step.get(doc["id"], 200) in (200, 201),
+                status_code=step.get(doc["id"], 200),
+                error_message=None,
+            )
+            for doc in documents
+        ]
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    monkeypatch.setattr(rag_indexer.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(rag_indexer, "UPLOAD_INITIAL_BATCH_SIZE", 2)
+    monkeypatch.setattr(rag_indexer, "UPLOAD_GROWTH_STREAK", 2)
+    instance = RAGIndexer.__new__(RAGIndexer)  # no Azure clients needed
+    instance._upload_batch_sizes = {}
+    return instance
+
+
+def _docs(count):
+    return [{"id": f"doc_{i}"} for i in range(count)]
+
+
+def test_batch_size_grows_after_clean_streak(indexer):
+    client = FakeSearchClient()
+    assert indexer._adaptive_upload(client, "idx", _docs(7)) == (0, [])
+    assert [len(batch) for batch in client.batches] == [2, 2, 3]
+    assert indexer._upload_batch_sizes["idx"] == 3
+
+
+def test_throttled_batch_halves_and_is_resent(indexer, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rag_indexer.time, "sleep", sleeps.append)
+    indexer._upload_batch_sizes["idx"] = 4
+    client = FakeSearchClient([_error(503)])
+    assert indexer._adaptive_upload(client, "idx", _docs(4)) == (0, [])
+    assert [len(batch) for batch in client.batches] == [4, 2, 2]
+    assert sleeps == [2]
+    assert sorted(sum(client.batches[1:], [])) == [f"doc_{i}" for i in range(4)]
+
+
+def test_per_document_statuses(indexer):
+    client = FakeSearchClient([{"doc_0": 503, "doc_1": 400}])
+    count, first = indexer._adaptive_upload(client, "idx", _docs(2))
+    assert (count, first) == (1, ["doc_1"])
+    assert client.batches[1] == ["doc_0"]
+
+
+def test_non_retryable_error_propagates(indexer):
+    with pytest.raises(HttpResponseError):
+        indexer._adaptive_upload(FakeSearchClient([_error(400)]), "idx", _docs(2))
+
+
+def test_gives_up_with_bounded_failure_report(indexer, monkeypatch):
+    monkeypatch.setattr(rag_indexer, "UPLOAD_MAX_RETRIES", 2)
+    client = FakeSearchClient([_error(503)] * 10)
+    count, first = indexer._adaptive_upload(client, "idx", _docs(8))
+    assert count == 8
+    assert len(first) == rag_indexer.MAX_REPORTED_FAILURES
+    assert len(client.batches) == 3
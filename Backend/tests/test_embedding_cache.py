@@ -0,0 +1,73 @@
+"""
+Tests for the SQLite chunk embedding cache and the question embedding LRU
+"""
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache, to_vec
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_to_vec_normalizes_to_float32():
+    vec = to_vec([3, 4])
+    assert vec.dtype == np.float32
+    assert vec.tolist() == pytest.approx([0.6, 0.8])
+    assert to_vec([0, 0]).tolist() == [0, 0]
+
+
+def test_round_trip_survives_reopening(cache):
+    key = EmbeddingCache.key_for("deployment", "chunk text")
+    cache.put_many([(key, [0.25, -0.5, 1.0])])
+    reopened = EmbeddingCache(cache.path)
+    assert reopened.get_many([key, "missing"]) == {key: [0.25, -0.5, 1.0]}
+    assert EmbeddingCache.key_for("other", "chunk text") != key
+
+
+def test_get_many_batches_past_the_parameter_limit(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_SQLITE_BATCH", 7)
+    keys = [f"k{i}" for i in range(50)]
+    cache.put_many((key, [float(i)]) for i, key in enumerate(keys))
+    found = cache.get_many(keys + keys[:5] + ["missing"])
+    assert found == {key: [float(i)] for i, key in enumerate(keys)}
+
+
+def test_get_many_at_default_batch_size(cache):
+    keys = [f"k{i}" for i in range(embedding_cache._SQLITE_BATCH * 2 + 1)]
+    cache.put_many((key, [1.0]) for key in keys)
+    assert len(cache.get_many(keys)) == len(keys)
+
+
+def test_dimensions_are_recorded_per_deployment(cache):
+    assert cache.get_dimension("small") is None
+    cache.put_dimension("small", 1536)
+    cache.put_dimension("large", 3072)
+    cache.put_dimension("small", 512)
+    assert cache.get_dimension("small") == 512
+    assert cache.get_dimension("large") == 3072
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("a", [1, 0])
+    cache.put("b", [0, 1])
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.put("c", [1, 1])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_query_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(ttl_seconds=10)
+    stored = cache.put("q", [2, 0])
+    assert stored.tolist() == [1.0, 0.0]
+    now[0] += 5
+    assert cache.get("q") is stored
+    now[0] += 6
+    assert cache.get("q") is None
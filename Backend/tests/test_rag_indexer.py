@@ -0,0 +1,196 @@
+"""
+Tests for RAGIndexer helpers that need no Azure connection
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from langchain_core.runnables import RunnableLambda
+
+import rag_indexer
+from embedding_cache import QueryEmbeddingCache, to_vec
+from rag_indexer import RAGIndexer
+
+
+def _indexer() -> RAGIndexer:
+    indexer = RAGIndexer.__new__(RAGIndexer)
+    indexer._init_caches()
+    return indexer
+
+
+def test_filter_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(rag_indexer, "FILTER_CACHE_MAX_ENTRIES", 2)
+    indexer = _indexer()
+    assert indexer._filter_for("a") == "chat_id eq 'a'"
+    indexer._filter_for("b")
+    assert indexer._filter_for("o'k") == "chat_id eq 'o''k'"
+    assert list(indexer._filter_cache) == ["b", "o'k"]
+    assert indexer._filter_for(None) is None
+
+
+class FakeDeleteClient:
+    """In-memory index; keys in `fail_once` report succeeded=False on their first delete."""
+
+    def __init__(self, ids, fail_once=()):
+        self.ids = set(ids)
+        self.fail_once = set(fail_once)
+        self.deletes = []
+
+    def search(self, search_text, filter, select):
+        return [{"id": key} for key in sorted(self.ids)]
+
+    def delete_documents(self, documents):
+        keys = [doc["id"] for doc in documents]
+        self.deletes.append(keys)
+        results = []
+        for key in keys:
+            failed = key in self.fail_once
+            self.fail_once.discard(key)
+            if not failed:
+                self.ids.discard(key)
+            results.append(SimpleNamespace(key=key, succeeded=not failed))
+        return results
+
+
+def test_delete_documents_retries_failed_keys():
+    indexer = _indexer()
+    indexer.search_client = FakeDeleteClient(["a", "b", "c"], fail_once=["b"])
+    assert indexer._delete_documents("chat-1") == 3
+    assert indexer.search_client.deletes == [["a", "b", "c"], ["b"]]
+    assert indexer.search_client.ids == set()
+
+
+def test_astream_query_ends_with_done_on_any_error():
+    indexer = _indexer()
+
+    async def failing_embed(question):
+        raise ConnectionError("network down")
+
+    indexer.aembed_query = failing_embed
+
+    async def collect():
+        return [event async for event in indexer.astream_query("q?", "chat-1")]
+
+    events = asyncio.run(collect())
+    assert events == [
+        {"type": "done", "success": False, "answer": "Error processing query: network down"}
+    ]
+
+
+class FakeIndexClient:
+    """Index client whose indexes all start missing; `exists_on_create` simulates another creator."""
+
+    def __init__(self, exists_on_create=False):
+        self.exists_on_create = exists_on_create
+        self.created = []
+        self.lock = threading.Lock()
+
+    def get_index(self, name):
+        raise ResourceNotFoundError(message=name)
+
+    def create_index(self, index):
+        time.sleep(0.01)  # widen the check-then-create window
+        with self.lock:
+            self.created.append(index.name)
+        if self.exists_on_create:
+            raise ResourceExistsError(message=index.name)
+
+
+def _search_indexer(index_client) -> RAGIndexer:
+    indexer = _indexer()
+    indexer.index_client = index_client
+    indexer.vector_dimensions = 8
+    indexer.search_endpoint = "https://example.search.windows.net"
+    indexer._credential = AzureKeyCredential("key")
+    indexer._transport = None
+    indexer.hnsw_parameters = {"m": 10, "efConstruction": 200, "efSearch": 100}
+    return indexer
+
+
+def test_concurrent_first_use_creates_the_index_once():
+    indexer = _search_indexer(FakeIndexClient())
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(indexer._get_search_client_for_chat, ["Chat One"] * 8))
+    assert indexer.index_client.created == ["rag-chat-one"]
+    assert all(client is clients[0] for client in clients)
+
+
+def test_index_created_elsewhere_counts_as_created():
+    indexer = _search_indexer(FakeIndexClient(exists_on_create=True))
+    client = indexer._get_search_client_for_chat("Chat One")
+    assert indexer.search_clients == {"rag-chat-one": client}
+
+
+def test_query_batch_isolates_failing_items():
+    indexer = _indexer()
+    indexer.query_embedding_cache = QueryEmbeddingCache()
+
+    def retrieve(vector, chat_id, chat_name):
+        if chat_id == "broken":
+            raise ConnectionError("search down")
+        if chat_id == "empty":
+            return [], []
+        return [f"context for {chat_id}"], [{"content": "...", "source": "a.pdf"}]
+
+    def answer(prompt):
+        if "boom" in prompt.to_string():
+            raise RuntimeError("llm down")
+        return "an answer"
+
+    def fail_batch(questions):
+        raise ConnectionError("batch embedding down")
+
+    indexer._retrieve = retrieve
+    indexer._llm = RunnableLambda(answer)
+    indexer.embed_questions = fail_batch
+    indexer.embed_query = lambda question: to_vec([1.0, 0.0])
+
+    vector = to_vec([0.0, 1.0])
+    results = indexer.query_batch([
+        ("ok?", "chat-1", None, vector),
+        ("q?", "broken", None, vector),
+        ("boom?", "chat-2", None, vector),
+        ("q?", "empty", None, vector),
+        ("needs embedding?", "chat-3", None, None),
+        ("q?", "  ", None, vector),
+    ])
+
+    assert [result["success"] for result in results] == [True, False, False, True, True, False]
+    assert results[0]["answer"] == "an answer"
+    assert results[1]["answer"] == "Error processing query: search down"
+    assert results[2]["answer"] == "Error processing query: llm down"
+    assert results[3] == RAGIndexer._no_results()
+    assert results[4]["sources"] == [{"content": "...", "source": "a.pdf"}]
+    assert set(indexer.chat_history) == {"chat-1", "chat-3"}
+
+
+def _configured_indexer() -> RAGIndexer:
+    indexer = RAGIndexer.__new__(RAGIndexer)
+    for attribute in (
+        "search_endpoint", "search_key", "index_name", "embedding_deployment",
+        "api_version", "azure_openai_endpoint", "azure_openai_key", "chat_deployment",
+    ):
+        setattr(indexer, attribute, "set")
+    return indexer
+
+
+def test_hnsw_settings_are_parsed_with_defaults(monkeypatch):
+    monkeypatch.delenv("HNSW_M", raising=False)
+    monkeypatch.setenv("HNSW_EF_CONSTRUCTION", "400")
+    indexer = _configured_indexer()
+    indexer._validate_environment()
+    assert indexer.hnsw_parameters == {"m": 10, "efConstruction": 400, "efSearch": 100}
+
+
+def test_invalid_hnsw_settings_raise_value_error(monkeypatch):
+    monkeypatch.setenv("HNSW_M", "ten")
+    monkeypatch.setenv("HNSW_EF_SEARCH", "5000")
+    with pytest.raises(ValueError) as excinfo:
+        _configured_indexer()._validate_environment()
+    assert "HNSW_M='ten'" in str(excinfo.value)
+    assert "HNSW_EF_SEARCH=5000" in str(excinfo.value)
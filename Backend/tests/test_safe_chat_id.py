@@ -0,0 +1,33 @@
+"""
+Tests for mapping chat_ids to upload folder names
+"""
+import pytest
+
+from Main import CHAT_DIR_MAX_LENGTH, _safe_chat_id
+
+
+@pytest.mark.parametrize(
+    "chat_id, expected",
+    [
+        ("chat-123", "chat-123"),
+        ("", "_"),
+        (".", "_"),
+        ("..", "_"),
+        ("...", "_"),
+        ("a/../b", "a__b"),
+        ("../../etc", "__etc"),
+        ("a\\b", "a_b"),
+        ("nul\0byte", "nul_byte"),
+        ("C:drive", "C_drive"),
+    ],
+)
+def test_safe_chat_id_is_one_safe_component(chat_id, expected):
+    assert _safe_chat_id(chat_id) == expected
+
+
+def test_long_chat_ids_are_cut_with_a_distinguishing_suffix():
+    prefix = "x" * CHAT_DIR_MAX_LENGTH
+    first, second = _safe_chat_id(prefix + "a"), _safe_chat_id(prefix + "b")
+    assert len(first) == len(second) == CHAT_DIR_MAX_LENGTH
+    assert first != second
+    assert _safe_chat_id(prefix) == prefix  # ids at the limit are kept as-is
@@ -0,0 +1,96 @@
+"""
+Tests for the semantic caches (in-process int8 cache and Redis key helpers)
+"""
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import LocalSemanticCache
+
+DIMS = 64
+RESULT = {"success": True, "answer": "42", "sources": [{"content": "...", "source": "a.pdf"}]}
+
+
+def _vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(DIMS).astype(np.float32)
+
+
+def test_quantize_preserves_cosine_similarity():
+    a, b = _vector(1), _vector(2)
+    qa, sa = LocalSemanticCache._quantize(a)
+    qb, sb = LocalSemanticCache._quantize(b)
+    assert qa.dtype == np.int8 and np.abs(qa).max() == 127
+    exact = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+    approx = float(qa.astype(np.int32) @ qb.astype(np.int32)) * sa * sb
+    assert approx == pytest.approx(exact, abs=0.02)
+
+
+def test_quantize_zero_vector():
+    quantized, scale = LocalSemanticCache._quantize(np.zeros(DIMS, dtype=np.float32))
+    assert scale == 0.0
+    assert not quantized.any()
+
+
+def test_lookup_hits_near_duplicate_and_respects_threshold():
+    cache = LocalSemanticCache(DIMS, threshold=0.95, capacity=8)
+    vector = _vector(3)
+    cache.store("chat-1", "q", vector, RESULT)
+
+    hit = cache.lookup("chat-1", vector * 2.0)  # scale-invariant
+    assert hit == {"success": True, "answer": "42", "sources": RESULT["sources"]}
+    assert hit["sources"] is not RESULT["sources"]
+
+    assert cache.lookup("chat-1", _vector(4)) is None
+
+
+def test_lookup_is_scoped_per_chat():
+    cache = LocalSemanticCache(DIMS, capacity=8)
+    vector = _vector(5)
+    cache.store("chat-1", "q", vector, RESULT)
+    assert cache.lookup("chat-2", vector) is None
+
+
+def test_expired_entries_are_ignored(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    cache = LocalSemanticCache(DIMS, ttl_seconds=10, capacity=8)
+    vector = _vector(6)
+    cache.store("chat-1", "q", vector, RESULT)
+    now[0] += 11
+    assert cache.lookup("chat-1", vector) is None
+
+
+def test_ring_buffer_evicts_oldest():
+    cache = LocalSemanticCache(DIMS, capacity=2)
+    first, second, third = _vector(7), _vector(8), _vector(9)
+    cache.store("chat-1", "first", first, RESULT)
+    cache.store("chat-1", "second", second, RESULT)
+    cache.store("chat-1", "third", third, RESULT)
+    assert cache.lookup("chat-1", first) is None
+    assert cache.lookup("chat-1", second) is not None
+    assert cache.lookup("chat-1", third) is not None
+
+
+def test_clear_one_chat_or_all():
+    cache = LocalSemanticCache(DIMS, capacity=8)
+    vector = _vector(10)
+    cache.store("chat-1", "q", vector, RESULT)
+    cache.store("chat-2", "q", vector, RESULT)
+
+    assert cache.clear("chat-1") == 1
+    assert cache.lookup("chat-1", vector) is None
+    assert cache.lookup("chat-2", vector) is not None
+    assert cache.clear("unknown") == 0
+
+    # A chat created after a clear must not reuse a live chat's code
+    cache.store("chat-3", "q", _vector(11), RESULT)
+    assert cache.lookup("chat-2", vector) is not None
+
+    assert cache.clear() == 2
+    assert cache.lookup("chat-2", vector) is None
+
+
+def test_redis_chat_key_is_a_plain_unique_token():
+    keys = {semantic_cache.SemanticCache._chat_key(chat_id) for chat_id in ("foo", "foo,bar", "foo:bar", "foo*")}
+    assert len(keys) == 4
+    assert all(key.isalnum() for key in keys)
@@ -0,0 +1,38 @@
+"""
+Tests for /status conditional GET helpers in Main
+"""
+import pytest
+
+import Main
+from Main import _etag_matches, _store_status
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, False),
+        ("", False),
+        ('"abc123"', True),
+        ('W/"abc123"', True),
+        ('"other", "abc123"', True),
+        ('"other"', False),
+        ("*", True),
+    ],
+)
+def test_etag_matches(header, expected):
+    assert _etag_matches(header, ETAG) is expected
+
+
+def test_store_status_drops_expired_and_caps_size(monkeypatch):
+    monkeypatch.setattr(Main, "status_cache", {})
+    monkeypatch.setattr(Main, "STATUS_CACHE_MAX_ENTRIES", 3)
+
+    _store_status("old", ETAG, {}, now=0.0)
+    _store_status("fresh", ETAG, {}, now=Main.STATUS_CACHE_TTL + 1)
+    assert set(Main.status_cache) == {"fresh"}
+
+    for chat_id in ("a", "b", "c"):
+        _store_status(chat_id, ETAG, {}, now=Main.STATUS_CACHE_TTL + 1)
+    assert list(Main.status_cache) == ["a", "b", "c"]
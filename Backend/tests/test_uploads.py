@@ -0,0 +1,112 @@
+"""
+Tests for the resumable upload helpers in Main
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import Main
+from Main import UploadState, _close_upload, _received_bytes, _write_chunk
+
+
+def _state(tmp_path, total_size=10) -> UploadState:
+    path = str(tmp_path / "upload.bin")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    os.ftruncate(fd, total_size)
+    return UploadState(
+        chat_id="chat-1", chat_name=None, filename="a.txt",
+        total_size=total_size, path=path, fd=fd,
+    )
+
+
+@pytest.mark.parametrize(
+    "ranges, expected",
+    [
+        (set(), 0),
+        ({(0, 4)}, 5),
+        ({(0, 4), (5, 9)}, 10),
+        ({(0, 4), (2, 6)}, 7),           # overlapping retry
+        ({(0, 9), (3, 5)}, 10),          # contained range
+        ({(0, 1), (5, 6)}, 4),           # gap
+    ],
+)
+def test_received_bytes_merges_ranges(tmp_path, ranges, expected):
+    state = _state(tmp_path)
+    state.received_ranges = set(ranges)
+    try:
+        assert _received_bytes(state) == expected
+    finally:
+        _close_upload(state)
+
+
+def test_write_chunk_writes_at_offset(tmp_path):
+    state = _state(tmp_path)
+    _write_chunk(state, b"world", 5)
+    _write_chunk(state, b"hello", 0)
+    _close_upload(state, sync=True)
+    with open(state.path, "rb") as f:
+        assert f.read() == b"helloworld"
+    assert _received_bytes(state) == 10
+
+
+def test_write_after_close_is_rejected(tmp_path):
+    state = _state(tmp_path)
+    _close_upload(state)
+    _close_upload(state)  # closing twice is a no-op
+    with pytest.raises(HTTPException) as excinfo:
+        _write_chunk(state, b"late", 0)
+    assert excinfo.value.status_code == 409
+
+
+def test_prune_removes_idle_uploads(tmp_path, monkeypatch):
+    state = _state(tmp_path)
+    state.last_activity -= Main.PENDING_UPLOAD_TTL_SECONDS + 1
+    monkeypatch.setattr(Main, "pending_uploads", {"stale": state})
+    Main._prune_pending_uploads()
+    assert Main.pending_uploads == {}
+    assert state.closed
+    assert not os.path.exists(state.path)
+
+
+def _initiate(chat_id="chat-1"):
+    request = Main.UploadInitiateRequest(chat_id=chat_id, filename="a.txt", total_size=10)
+    return asyncio.run(Main.initiate_upload(request))
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(Main, "pending_uploads", {})
+    yield tmp_path
+    for state in list(Main.pending_uploads.values()):
+        _close_upload(state, remove=True)
+
+
+def test_initiate_removes_file_when_preallocate_fails(upload_dir, monkeypatch):
+    def fail(fd, size):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Main, "_preallocate", fail)
+    with pytest.raises(HTTPException) as excinfo:
+        _initiate()
+    assert excinfo.value.status_code == 500
+    assert Main.pending_uploads == {}
+    assert not any(path.is_file() for path in upload_dir.rglob("*"))
+
+
+def test_initiate_rejects_beyond_pending_limits(upload_dir, monkeypatch):
+    monkeypatch.setattr(Main, "MAX_PENDING_UPLOADS_PER_CHAT", 2)
+    monkeypatch.setattr(Main, "MAX_PENDING_UPLOADS", 3)
+    _initiate("chat-1")
+    _initiate("chat-1")
+    with pytest.raises(HTTPException) as excinfo:
+        _initiate("chat-1")
+    assert excinfo.value.status_code == 429
+
+    _initiate("chat-2")
+    with pytest.raises(HTTPException) as excinfo:
+        _initiate("chat-3")
+    assert excinfo.value.status_code == 429
+    assert len(Main.pending_uploads) == 3
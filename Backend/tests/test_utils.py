@@ -0,0 +1,43 @@
+"""
+Tests for the shared process pool fallbacks in utils
+"""
+from concurrent.futures.process import BrokenProcessPool
+
+import utils
+
+
+class BrokenPool:
+    """Stands in for a ProcessPoolExecutor whose worker has died."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("worker died")
+
+    def map(self, *args, **kwargs):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_split_falls_back_inline_and_resets_broken_pool(monkeypatch):
+    pool = BrokenPool()
+    monkeypatch.setattr(utils, "PDF_WORKERS", 4)
+    monkeypatch.setattr(utils, "_process_pool", pool)
+
+    text = "word " * 500
+    chunks = utils.split_text_in_pool(text, chunk_size=100, chunk_overlap=10)
+
+    assert chunks == utils._split_text(text, 100, 10)
+    assert pool.shut_down
+    assert utils._process_pool is None
+
+
+def test_reset_keeps_a_replacement_pool(monkeypatch):
+    broken, replacement = BrokenPool(), BrokenPool()
+    monkeypatch.setattr(utils, "_process_pool", replacement)
+    utils._reset_process_pool(broken)
+    assert utils._process_pool is replacement
+    assert broken.shut_down
@@ -22,6 +22,17 @@ const FileUploader = ({ chatId, chatName, onUploadSuccess, variant = 'full' }) =
     }
   };
 
+  const waitForJob = async (statusUrl) => {
+    while (true) {
+      const { data } = await axios.get(`http://localhost:8000${statusUrl}`);
+      if (data.state === 'completed') return data;
+      if (data.state === 'failed') {
+        throw { response: { data: { detail: data.error || 'Document processing failed' } } };
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const uploadFile = async (fileToUpload = file) => {
     if (!fileToUpload) {
       setError('Please select a file first');
@@ -46,7 +57,10 @@ const FileUploader = ({ chatId, chatName, onUploadSuccess, variant = 'full' }) =
         },
       });
 
-      setMessage(`✓ ${response.data.message} (${response.data.chunks} chunks processed)`);
+      // Processing runs in the background; poll the job until it finishes
+      const job = await waitForJob(response.data.status_url);
+
+      setMessage(`✓ ${job.message} (${job.chunks} chunks processed)`);
       setFile(null);
       
       // Reset file input
@@ -55,7 +69,7 @@ const FileUploader = ({ chatId, chatName, onUploadSuccess, variant = 'full' }) =
 
       // Notify parent component
       if (onUploadSuccess) {
-        onUploadSuccess(response.data);
+        onUploadSuccess(job);
       }
 
       // Clear success message after 5 seconds